@@ -0,0 +1,5 @@
+"""Sync AEX services, work orders and customers into HubSpot contacts and tickets.
+
+Submodules are imported on demand so that importing the package (or starting the CLI)
+does not pull in pandas or require API credentials.
+"""
@@ -0,0 +1,230 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter, deque
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from . import config
+from .config import current_network, base_url, aex_headers, hubspot_headers
+
+class RateLimiter:
+    """Token bucket shared by several callers (networks). When callers are waiting, the one
+    that has been granted the fewest requests so far goes next, so one busy network cannot
+    starve the others of a shared budget. A rate of None or 0 means unlimited."""
+
+    def __init__(self, rate_per_second):
+        self.rate = rate_per_second
+        self.capacity = max(rate_per_second or 1, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.granted = Counter()
+        self.waiting = Counter()
+        self.condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _is_next(self, key):
+        return self.granted[key] <= min(self.granted[waiting_key] for waiting_key in self.waiting)
+
+    def acquire(self, key):
+        if not self.rate:
+            return
+        with self.condition:
+            self.waiting[key] += 1
+            try:
+                while True:
+                    self._refill()
+                    if self.tokens >= 1 and self._is_next(key):
+                        self.tokens -= 1
+                        self.granted[key] += 1
+                        return
+                    self.condition.wait((1 - self.tokens) / self.rate if self.tokens < 1 else 0.05)
+            finally:
+                self.waiting[key] -= 1
+                if not self.waiting[key]:
+                    del self.waiting[key]
+                self.condition.notify_all()
+
+# Request timeouts in seconds: one connect timeout, and a read timeout per upstream and
+# endpoint family (the path with ids replaced for AEX, the CRM object for HubSpot)
+CONNECT_TIMEOUT_SECONDS = float(os.getenv('CONNECT_TIMEOUT_SECONDS', 5))
+AEX_READ_TIMEOUTS = {
+    "default": float(os.getenv('AEX_READ_TIMEOUT_SECONDS', 30)),
+    "work-orders": 60,   # bulk pages are the largest responses
+}
+HUBSPOT_READ_TIMEOUTS = {
+    "default": float(os.getenv('HUBSPOT_READ_TIMEOUT_SECONDS', 20)),
+    "associations": 30,
+}
+
+# Circuit breaker settings: a breaker opens when at least CIRCUIT_ERROR_RATE of the last
+# CIRCUIT_WINDOW calls (and no fewer than CIRCUIT_MIN_CALLS) failed, rejects calls for
+# CIRCUIT_COOLDOWN_SECONDS, then lets one probe call through to decide whether to close again
+CIRCUIT_WINDOW = int(os.getenv('CIRCUIT_WINDOW', 20))
+CIRCUIT_MIN_CALLS = int(os.getenv('CIRCUIT_MIN_CALLS', 5))
+CIRCUIT_ERROR_RATE = float(os.getenv('CIRCUIT_ERROR_RATE', 0.5))
+CIRCUIT_COOLDOWN_SECONDS = float(os.getenv('CIRCUIT_COOLDOWN_SECONDS', 30))
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of sending a request while the endpoint's breaker is open. It is a
+    RequestException, so callers that already handle request failures handle it too."""
+
+class CircuitBreaker:
+    """Error-rate circuit breaker for one upstream endpoint family. Timeouts, connection
+    errors, 5xx and 429 responses count as failures; any other response is a success."""
+
+    def __init__(self, name, window=None, min_calls=None, error_rate=None, cooldown=None):
+        self.name = name
+        self.min_calls = min_calls or CIRCUIT_MIN_CALLS
+        self.error_rate = error_rate or CIRCUIT_ERROR_RATE
+        self.cooldown = cooldown or CIRCUIT_COOLDOWN_SECONDS
+        self.outcomes = deque(maxlen=window or CIRCUIT_WINDOW)
+        self.state = 'closed'
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    # Reserve a call, or raise CircuitOpenError. After the cool-down, one caller is let through
+    # as the half-open probe; everyone else keeps failing fast until the probe completes.
+    def before_call(self):
+        with self.lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+                logging.info(f"Circuit {self.name} half-open, probing")
+                return
+            raise CircuitOpenError(f"Circuit {self.name} is open")
+
+    def record(self, succeeded):
+        with self.lock:
+            if self.state == 'half_open':
+                if succeeded:
+                    self.state = 'closed'
+                    self.outcomes.clear()
+                    logging.info(f"Circuit {self.name} closed")
+                else:
+                    self._open()
+                return
+
+            self.outcomes.append(succeeded)
+            failures = self.outcomes.count(False)
+            if self.state == 'closed' and len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.error_rate:
+                self._open()
+
+    def _open(self):
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        logging.error(f"Circuit {self.name} opened; failing fast for {self.cooldown:.0f}s")
+
+    def is_open(self):
+        with self.lock:
+            return self.state != 'closed'
+
+# Error class to record for a failed call when parking its work as a dead letter
+def error_class(error):
+    return 'circuit_open' if isinstance(error, CircuitOpenError) else type(error).__name__
+
+# Error class of a failed request (timeout, connection error, open breaker), or None when the
+# error did not come from the request itself (e.g. an unexpected status raised by the caller)
+def request_error_class(error):
+    if isinstance(error, requests.exceptions.RequestException):
+        return error_class(error)
+    return None
+
+def _failed(response):
+    return response.status_code >= 500 or response.status_code == 429
+
+_lock = threading.Lock()
+_breakers = {}
+_aex_sessions = {}
+_aex_limiters = {}
+_hubspot = {}
+
+def _new_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Connection pool and rate limiter of the current network, created on first use
+def _aex_client():
+    network = current_network()
+    with _lock:
+        if network.name not in _aex_sessions:
+            _aex_sessions[network.name] = _new_session(network.pool_size)
+            _aex_limiters[network.name] = RateLimiter(network.rate_limit_per_second)
+        return _aex_sessions[network.name], _aex_limiters[network.name]
+
+# The single HubSpot session and the budget all networks share
+def _hubspot_client():
+    with _lock:
+        if not _hubspot:
+            _hubspot['session'] = _new_session(10)
+            _hubspot['limiter'] = RateLimiter(config.HUBSPOT_RATE_LIMIT_PER_SECOND)
+        return _hubspot['session'], _hubspot['limiter']
+
+def _breaker(upstream, family):
+    with _lock:
+        key = (upstream, family)
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(f"{upstream}/{family}")
+        return _breakers[key]
+
+# AEX endpoint family: the path after the network's base URL with ids replaced, so "services",
+# "services/{id}" and "services/{id}/full" each get their own breaker
+def _aex_family(url):
+    path = url[len(base_url()):].split('?')[0].strip('/')
+    return '/'.join('{id}' if segment.isdigit() else segment for segment in path.split('/')) or "default"
+
+# HubSpot endpoint family: "associations", or the CRM object type ("contacts", "tickets")
+def _hubspot_family(url):
+    segments = urlsplit(url).path.strip('/').split('/')
+    if 'associations' in segments:
+        return 'associations'
+    if 'objects' in segments and segments.index('objects') + 1 < len(segments):
+        return segments[segments.index('objects') + 1]
+    return "default"
+
+# Send a request through the breaker for its endpoint family, with that family's timeout
+def _send(session, method, url, headers, breaker, read_timeouts, family, **kwargs):
+    breaker.before_call()
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT_SECONDS, read_timeouts.get(family, read_timeouts['default'])))
+    try:
+        response = session.request(method, url, headers=headers, **kwargs)
+    except requests.exceptions.RequestException:
+        breaker.record(False)
+        raise
+    breaker.record(not _failed(response))
+    return response
+
+# GET against the current AEX network through its own pool, rate limit and breakers
+def aex_get(url, **kwargs):
+    session, limiter = _aex_client()
+    network = current_network().name
+    family = _aex_family(url)
+    breaker = _breaker(f"aex:{network}", family)
+    if not breaker.is_open():
+        limiter.acquire(network)
+    return _send(session, "GET", url, aex_headers(), breaker, AEX_READ_TIMEOUTS, family, **kwargs)
+
+# Request against HubSpot, drawing from the shared budget on behalf of the current network.
+# HubSpot breakers are shared by all networks, since they all talk to the same upstream.
+def hubspot_request(method, url, **kwargs):
+    session, limiter = _hubspot_client()
+    family = _hubspot_family(url)
+    breaker = _breaker("hubspot", family)
+    if not breaker.is_open():
+        limiter.acquire(current_network().name)
+    return _send(session, method, url, hubspot_headers(), breaker, HUBSPOT_READ_TIMEOUTS, family, **kwargs)
+
+def hubspot_post(url, **kwargs):
+    return hubspot_request("POST", url, **kwargs)
+
+def hubspot_patch(url, **kwargs):
+    return hubspot_request("PATCH", url, **kwargs)
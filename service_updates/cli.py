@@ -0,0 +1,92 @@
+import os
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from . import profiling
+from .config import load_networks, use_network, run_in_network, require_aex_credentials, require_hubspot_credentials
+
+# Fetch updated services from AEX and hand them to the enrichment stage
+def fetch(args):
+    from . import customers
+    customers.create_customers_json()
+
+# Enrich the fetched services with service details, work orders and customers
+def enrich(args):
+    from . import data
+    data.enrich_and_save()
+
+# Push the enriched premises to HubSpot as contacts and tickets
+def push(args):
+    from . import hub
+    hub.process_premises_for_hubspot()
+
+# Run fetch, enrich and push in one process. Urgent premises are enriched and pushed before
+# the rest are enriched (see data.enrich_and_save).
+def run(args):
+    from . import data, hub
+    fetch(args)
+    data.enrich_and_save(push=hub.process_premises_for_hubspot)
+
+# Retry stored dead letters with backoff
+def replay(args):
+    from . import dead_letter
+    dead_letter.replay(args.stage, args.error_class, args.max_attempts, args.backoff)
+
+# Credentials each command needs; they are checked before any work starts
+COMMANDS = {
+    "fetch": (fetch, "Fetch updated services from AEX", (require_aex_credentials,)),
+    "enrich": (enrich, "Enrich fetched services with details, work orders and customers", (require_aex_credentials,)),
+    "push": (push, "Push enriched premises to HubSpot", (require_hubspot_credentials,)),
+    "run": (run, "Run fetch, enrich and push", (require_aex_credentials, require_hubspot_credentials)),
+    "replay": (replay, "Retry stored dead letters with backoff", ())
+}
+
+# Run a command once per configured AEX network. Several networks are synced concurrently,
+# each in its own thread with its own connection pool, rate limit and state directory, while
+# sharing the HubSpot budget. Returns the names of networks whose run failed.
+def for_each_network(networks, command, args):
+    if len(networks) == 1:
+        with use_network(networks[0]):
+            command(args)
+        return []
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=len(networks), thread_name_prefix="network") as executor:
+        futures = {network.name: executor.submit(run_in_network, network, command, args) for network in networks}
+        for name, future in futures.items():
+            try:
+                future.result()
+                logging.info(f"Network {name}: {args.command} completed")
+            except Exception as e:
+                logging.error(f"Network {name}: {args.command} failed: {e}")
+                failed.append(name)
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="service_updates", description="Sync AEX service updates into HubSpot")
+    profiling.add_profile_argument(parser)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text, _) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        if name == "replay":
+            from .dead_letter import REPLAY_MAX_ATTEMPTS, REPLAY_BACKOFF_SECONDS
+            subparser.add_argument("--stage")
+            subparser.add_argument("--error-class")
+            subparser.add_argument("--max-attempts", type=int, default=REPLAY_MAX_ATTEMPTS)
+            subparser.add_argument("--backoff", type=float, default=REPLAY_BACKOFF_SECONDS)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+
+    networks = load_networks()
+    command, _, credential_checks = COMMANDS[args.command]
+    for network in networks:
+        for check in credential_checks:
+            run_in_network(network, check)
+
+    if args.profile:
+        profiling.enable(args.profile, prefix=args.command)
+    failed = for_each_network(networks, command, args)
+    profiling.write_results()
+    if failed:
+        raise SystemExit(f"{args.command} failed for network(s): {', '.join(failed)}")
@@ -0,0 +1,119 @@
+import os
+import json
+import logging
+import contextvars
+from contextlib import contextmanager
+
+# Base URL for API (the default network when no AEX_NETWORKS_FILE is configured)
+BASE_URL = "https://fno.national-us.aex.systems"
+
+# Shared HubSpot request budget (requests per second) across all networks in a run
+HUBSPOT_RATE_LIMIT_PER_SECOND = float(os.getenv('HUBSPOT_RATE_LIMIT_PER_SECOND', 10))
+
+class Network:
+    """One AEX deployment: where to reach it, which credentials to use, where its state lives
+    and any per-network overrides of the sales rep / pipeline stage mappings."""
+
+    def __init__(self, name, base_url, token_env='API_TOKEN', state_dir=None, sales_rep_file=None,
+                 installation_pipeline_stages=None, service_pipeline_stages=None,
+                 rate_limit_per_second=None, pool_size=10):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.token_env = token_env
+        self.state_dir = state_dir or os.path.join('state', name)
+        self.sales_rep_file = sales_rep_file
+        self.installation_pipeline_stages = installation_pipeline_stages or {}
+        self.service_pipeline_stages = service_pipeline_stages or {}
+        self.rate_limit_per_second = rate_limit_per_second
+        self.pool_size = pool_size
+
+    def __repr__(self):
+        return f"Network({self.name!r}, {self.base_url!r})"
+
+# The single-network setup keeps its state in the working directory, as before
+DEFAULT_NETWORK = Network("default", BASE_URL, state_dir='.')
+
+_current_network = contextvars.ContextVar('current_network', default=DEFAULT_NETWORK)
+
+# Load the AEX networks to sync. AEX_NETWORKS_FILE is a JSON file of the form
+# {"hubspot_rate_limit_per_second": 10, "networks": [{"name": ..., "base_url": ..., "token_env": ...,
+#  "state_dir": ..., "sales_rep_file": ..., "installation_pipeline_stages": {...}, ...}]}.
+# state_dir defaults to state/<name>; networks run in parallel and must not share one.
+# Without it, the single default network (BASE_URL with API_TOKEN) is used.
+def load_networks(filename=None):
+    global HUBSPOT_RATE_LIMIT_PER_SECOND
+    filename = filename or os.getenv('AEX_NETWORKS_FILE')
+    if not filename:
+        return [DEFAULT_NETWORK]
+
+    with open(filename, 'r') as json_file:
+        network_config = json.load(json_file)
+
+    if 'hubspot_rate_limit_per_second' in network_config:
+        HUBSPOT_RATE_LIMIT_PER_SECOND = float(network_config['hubspot_rate_limit_per_second'])
+
+    networks = [Network(**entry) for entry in network_config.get('networks', [])]
+    names = [network.name for network in networks]
+    if not networks or len(set(names)) != len(names):
+        raise Exception(f"'{filename}' must list at least one network, each with a unique name")
+    state_dirs = [os.path.normpath(os.path.abspath(network.state_dir)) for network in networks]
+    if len(set(state_dirs)) != len(state_dirs):
+        raise Exception(f"'{filename}' must give each network its own state_dir")
+    for network in networks:
+        os.makedirs(network.state_dir, exist_ok=True)
+    logging.info(f"Loaded {len(networks)} AEX networks from {filename}: {', '.join(names)}")
+    return networks
+
+def current_network():
+    return _current_network.get()
+
+# Run the enclosed code against the given network
+@contextmanager
+def use_network(network):
+    token = _current_network.set(network)
+    try:
+        yield network
+    finally:
+        _current_network.reset(token)
+
+# Call func(*args) against the given network; used to carry the network into worker threads,
+# which do not inherit the caller's context
+def run_in_network(network, func, *args, **kwargs):
+    with use_network(network):
+        return func(*args, **kwargs)
+
+def base_url():
+    return current_network().base_url
+
+# Resolve a state/handoff file name inside the current network's state directory
+def state_path(filename):
+    return os.path.join(current_network().state_dir, filename)
+
+# Headers for AEX API requests. The token is read when a request is built, not at import,
+# so the package can be imported without credentials.
+def aex_headers():
+    token_env = current_network().token_env
+    api_token = os.getenv(token_env)   # Fetching API token from environment variable
+    if not api_token:
+        raise Exception(f"{token_env} environment variable is not set")
+    return {
+        "Authorization": f"Bearer {api_token}",
+        "Content-Type": "application/json"
+    }
+
+# Headers for HubSpot API requests with Bearer token
+def hubspot_headers():
+    access_token = os.getenv('SERVICE_UPDATE_INTEGRATION')
+    if not access_token:
+        raise Exception("SERVICE_UPDATE_INTEGRATION environment variable is not set")
+    return {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+
+# Fail fast, before any work starts, when a command's credentials are missing
+def require_aex_credentials():
+    aex_headers()
+
+def require_hubspot_credentials():
+    hubspot_headers()
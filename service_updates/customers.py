@@ -0,0 +1,194 @@
+import json
+from datetime import datetime, timedelta
+import logging
+import argparse
+from . import store
+from . import snapshot
+from . import dead_letter
+from . import profiling
+from . import api
+from .config import base_url, state_path, require_aex_credentials
+
+
+# Set the number of hours for 'updated_after'. If None, defaults to 24 hours.
+HOURS = 24
+
+# Function to get 'updated_after' date (24 hours prior or custom interval)
+def get_updated_after(hours=None):
+    if hours is None:
+        hours = 24
+    pull_time = datetime.now() - timedelta(hours=hours)
+    formatted_time = pull_time.isoformat().replace('T', ' ').split('.')[0]
+    return formatted_time
+
+# Fetch premises with updated_after filter and handle pagination
+def fetch_premises(updated_after, page=1):
+    url = f"{base_url()}/services"
+    params = {
+        "updated_after": updated_after,
+        "page": page
+    }
+
+    try:
+        logging.info(f"Fetching premises data for page {page}")
+        response = api.aex_get(url, params=params)
+        if response.status_code == 200:
+            logging.info(f"Successfully fetched data for page {page}")
+            return response.json()
+        else:
+            raise Exception(f"Error fetching premises (page {page}): {response.status_code}")
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        return None
+
+# Fetch details for a specific service by ID. Request errors are appended to the optional
+# errors list so a dropped service is parked with the class of the failed call.
+def fetch_service_details(service_id, errors=None):
+    url = f"{base_url()}/services/{service_id}"
+    try:
+        logging.info(f"Fetching details for service ID {service_id}")
+        response = api.aex_get(url)
+        if response.status_code == 200:
+            logging.info(f"Successfully fetched details for service ID {service_id}")
+            return response.json()
+        else:
+            raise Exception(f"Error fetching details for service ID {service_id}: {response.status_code}")
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        error_class = api.request_error_class(e)
+        if errors is not None and error_class:
+            errors.append(error_class)
+        return None
+
+# Combine a /services list item with the status from its details
+def service_entry(service, service_details):
+    return {
+        "id": service['id'],
+        "preorder": service.get('preorder'),
+        "customer_id": service.get('customer_id'),
+        "product_id": service.get('product_id'),
+        "premise_id": service.get('premise_id'),
+        "provisioned": service.get('provisioned'),
+        "on_network": service.get('on_network'),
+        "created_at": service.get('created_at'),
+        "updated_at": service.get('updated_at'),
+        "promo_code": service.get('promo_code'),
+        "sales_agent": service.get('sales_agent'),
+        "sales_channel_id": service.get('sales_channel_id'),
+        "cancelled": service.get('cancelled'),
+        "cancelled_date": service.get('cancelled_date'),
+        "status": service_details.get('status')  # Add status from secondary API call
+    }
+
+# Fetch services with updated_after filter, with their status from the service details.
+# A failed page aborts the fetch (the remaining pages are unknown, and saving a partial list
+# would look like a complete one); a service whose details fail is parked as a dead letter.
+def fetch_customer_data(updated_after):
+    logging.info(f"Fetching premises updated after {updated_after}")
+    customer_data = []
+    page = 1
+
+    while True:
+        services_data = fetch_premises(updated_after, page)
+        if services_data and 'items' in services_data:
+            services = services_data['items']
+            if not services:
+                logging.info(f"No more data available at page {page}")
+                break
+
+            logging.info(f"Processing {len(services)} services from page {page}")
+            for service in services:
+                service_id = service['id']
+                errors = []
+                service_details = fetch_service_details(service_id, errors)  # Fetch additional details
+                if service_details:
+                    # Merge service details with base data
+                    customer_data.append(service_entry(service, service_details))
+                else:
+                    dead_letter.record_failure('fetch', errors[0] if errors else 'service_details_fetch_failed',
+                                               {"service": service}, f"Error fetching details for service ID {service_id}")
+
+            # If the number of items is less than 10, assume it's the last page
+            if len(services) < 10:
+                logging.info(f"Reached the last page of data at page {page}")
+                break
+            page += 1
+        elif services_data is None:
+            raise Exception(f"Fetching services failed at page {page}; aborting the fetch")
+        else:
+            logging.info(f"No more data available at page {page}")
+            break
+
+    return customer_data
+
+# Save the fetched services to the state store, a snapshot or customers.json
+def save_customer_data(customer_data, updated_after):
+    if store.enabled():
+        store.upsert_services(customer_data)
+        store.set_sync_state('last_fetch', {"updated_after": updated_after, "services": len(customer_data)})
+    elif snapshot.enabled():
+        snapshot.write_snapshot(customer_data, state_path(snapshot.CUSTOMERS_SNAPSHOT))
+    else:
+        with open(state_path("customers.json"), 'w') as json_file:
+            json.dump(customer_data, json_file, indent=4)
+            logging.info(f"Data saved to customers.json")
+
+# Replace services in the saved fetch output (matched by id), appending new ones
+def merge_into_saved_services(services):
+    if store.enabled():
+        store.upsert_services(services)
+        return
+    try:
+        if snapshot.enabled():
+            saved_services = snapshot.read_snapshot(state_path(snapshot.CUSTOMERS_SNAPSHOT))
+        else:
+            with open(state_path("customers.json"), 'r') as json_file:
+                saved_services = json.load(json_file)
+    except FileNotFoundError:
+        saved_services = []
+
+    replacements = {service['id']: service for service in services}
+    merged = [replacements.pop(service.get('id'), service) for service in saved_services]
+    merged.extend(replacements.values())
+    if snapshot.enabled():
+        snapshot.write_snapshot(merged, state_path(snapshot.CUSTOMERS_SNAPSHOT))
+    else:
+        with open(state_path("customers.json"), 'w') as json_file:
+            json.dump(merged, json_file, indent=4)
+
+# Dead letter replay handler: re-fetch the details of a dropped service and add it to the
+# saved services, so the next enrichment picks it up
+def replay_fetch(payload):
+    service = payload['service']
+    service_details = fetch_service_details(service['id'])
+    if not service_details:
+        return False
+    merge_into_saved_services([service_entry(service, service_details)])
+    return True
+
+# Create customers.json file (or upsert into the state store) using services fetched with updated_after filter
+def create_customers_json():
+    updated_after = get_updated_after(HOURS)
+    with profiling.stage('fetch_services'):
+        customer_data = fetch_customer_data(updated_after)
+    with profiling.stage('save_services'):
+        save_customer_data(customer_data, updated_after)
+
+# Main function to demonstrate creating customers.json
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch updated AEX services")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.profile:
+        profiling.enable(args.profile, prefix="customers")
+
+    require_aex_credentials()
+    logging.info("Starting the process to create customers.json")
+    create_customers_json()
+    logging.info("Process completed")
+    profiling.write_results()
+
+# Run the main function
+if __name__ == "__main__":
+    main()
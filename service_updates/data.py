@@ -0,0 +1,384 @@
+import os
+import json
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from .customers import get_updated_after, HOURS
+from . import dead_letter
+from . import store
+from . import snapshot
+from . import profiling
+from . import priority
+from . import api
+from .config import base_url, state_path, current_network, run_in_network, require_aex_credentials
+
+# How work orders are gathered during enrichment: "bulk" pages through /work-orders once
+# for the run's window, "per_service" issues one /work-orders?service={id} call per premise
+WORK_ORDER_FETCH_MODE = os.getenv('WORK_ORDER_FETCH_MODE', 'bulk')
+
+# Number of concurrent workers used to fetch the distinct customers of a run
+CUSTOMER_FETCH_WORKERS = int(os.getenv('CUSTOMER_FETCH_WORKERS', 8))
+
+# Load premises data from the state store (only services changed since they were last
+# enriched, or whose work orders changed in work_orders_by_service) or from a JSON file
+def load_premises_data(filename="customers.json", work_orders_by_service=None):
+    if store.enabled():
+        return store.load_pending_services(work_orders_by_service)
+    if snapshot.enabled():
+        return snapshot.read_snapshot(state_path(snapshot.CUSTOMERS_SNAPSHOT))
+    with open(state_path(filename), 'r') as json_file:
+        data = json.load(json_file)
+        return data
+
+# Fetch premises by customer_id
+def fetch_premises_by_customer(customer_id):
+    url = f"{base_url()}/premises?customer={customer_id}"
+
+    try:
+        response = api.aex_get(url)
+        if response.status_code == 200:
+            return response.json().get("items", [])
+        else:
+            raise Exception(f"Error fetching premises for customer {customer_id}: {response.status_code}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return []
+
+# Request errors of the fetch helpers below are appended to the optional errors list, so a
+# parked premise is recorded with the error class of the call that actually failed
+
+# Fetch services by service_id
+def fetch_services(service_id, errors=None):
+    url = f"{base_url()}/services/{service_id}"
+
+    try:
+        response = api.aex_get(url)
+        if response.status_code == 200:
+            services_data = response.json()
+            print(f"Services Data for Service {service_id}: {services_data}")
+            return services_data
+        else:
+            raise Exception(f"Error fetching services for service {service_id}: {response.status_code}")
+    except Exception as e:
+        print(f"An error occurred while fetching services: {e}")
+        _record_error(errors, e)
+        return {}
+
+# Fetch full service details by service_id
+def fetch_service_details(service_id, errors=None):
+    full_service_url = f"{base_url()}/services/{service_id}/full"
+
+    try:
+        full_service_response = api.aex_get(full_service_url)
+
+        if full_service_response.status_code == 200:
+            return full_service_response.json()
+        else:
+            raise Exception(f"Error fetching details for service {service_id}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        _record_error(errors, e)
+        return {}
+
+# Fetch work orders by service_id
+def fetch_work_orders(service_id, errors=None):
+    url = f"{base_url()}/work-orders"
+    params = {"service": service_id}
+
+    try:
+        response = api.aex_get(url, params=params)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"Error fetching work orders for service {service_id}: {response.status_code}")
+    except Exception as e:
+        print(f"An error occurred while fetching work orders: {e}")
+        _record_error(errors, e)
+        return []
+
+# Fetch one page of work orders updated after the given time
+def fetch_work_orders_page(updated_after, page=1):
+    url = f"{base_url()}/work-orders"
+    params = {
+        "updated_after": updated_after,
+        "page": page
+    }
+
+    try:
+        response = api.aex_get(url, params=params)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"Error fetching work orders (page {page}): {response.status_code}")
+    except Exception as e:
+        print(f"An error occurred while fetching work orders: {e}")
+        return None
+
+# Page through /work-orders once for the window and group the results by service id.
+# Each value has the same {"items": [...]} shape that fetch_work_orders returns.
+# Returns None if any page fails, so the caller can fall back to per-service fetches
+# rather than treating the missing pages as "no work orders".
+def fetch_work_orders_by_service(updated_after):
+    work_orders_by_service = {}
+    page = 1
+
+    while True:
+        work_orders_data = fetch_work_orders_page(updated_after, page)
+        if work_orders_data is None:
+            print(f"Bulk work order fetch failed at page {page}")
+            return None
+        if 'items' not in work_orders_data:
+            break
+
+        work_orders = work_orders_data['items']
+        if not work_orders:
+            break
+
+        for work_order in work_orders:
+            service_id = work_order.get('service_id')
+            if service_id is None:
+                continue
+            work_orders_by_service.setdefault(service_id, {"items": []})["items"].append(work_order)
+
+        # If the number of items is less than 10, assume it's the last page
+        if len(work_orders) < 10:
+            break
+        page += 1
+
+    print(f"Fetched work orders for {len(work_orders_by_service)} services in {page} page(s)")
+    return work_orders_by_service
+
+# Fetch a single customer record (without its services, which enrichment does not use)
+def fetch_customer(customer_id, errors=None):
+    url = f"{base_url()}/customers/{customer_id}"
+
+    try:
+        response = api.aex_get(url)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"Error fetching customer {customer_id}: {response.status_code}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        _record_error(errors, e)
+        return {}
+
+def _record_error(errors, error):
+    error_class = api.request_error_class(error)
+    if errors is not None and error_class:
+        errors.append(error_class)
+
+# Start fetching each distinct customer once on a worker pool, in the order given (priority
+# order, so urgent premises' customers come first). Returns {customer_id: future}; request
+# errors are collected per customer id in the optional errors dict.
+def submit_customer_fetches(executor, customer_ids, errors=None):
+    customer_ids = list(dict.fromkeys(cid for cid in customer_ids if cid is not None))
+    if errors is not None:
+        errors.update((customer_id, []) for customer_id in customer_ids)
+
+    # Worker threads do not inherit the caller's network, so pass it along explicitly
+    network = current_network()
+    return {
+        customer_id: executor.submit(run_in_network, network, fetch_customer, customer_id,
+                                     errors.get(customer_id) if errors is not None else None)
+        for customer_id in customer_ids
+    }
+
+# Enrich each premise with its services, work orders, and customer details.
+# When work_orders_by_service is given, work orders are joined from that map instead of
+# being fetched per service; services missing from the map had no work-order activity.
+# Customers are fetched once per distinct customer_id on a background pool while the
+# service fetches run; each premise waits only for its own customer, so it is complete as
+# soon as its own fetches are.
+# Premises are enriched highest priority first (see priority.py), so urgent status changes
+# are not stuck behind routine ones; the result is in that order. Premises with a failed fetch
+# are parked as dead letters and left out of the result, so incomplete data is never saved or
+# pushed (in store mode they also stay pending for the next run).
+def enrich_premises_with_services_and_customers(premises_data, work_orders_by_service=None):
+    enriched_data = []
+    premises_data = list(priority.by_priority(premises_data, work_orders_by_service))
+
+    customer_errors = {}
+    customer_executor = ThreadPoolExecutor(max_workers=CUSTOMER_FETCH_WORKERS)
+    customer_futures = submit_customer_fetches(
+        customer_executor, [premise['customer_id'] for premise in premises_data], customer_errors
+    )
+
+    complete = []
+    try:
+        for premise in premises_data:
+            premise_id = premise['premise_id']
+            customer_id = premise['customer_id']
+            service_id = premise['id']  # Using 'id' from JSON as the service_id
+            premise_errors = []
+
+            # Fetch related services for this premise using service_id
+            services = fetch_services(service_id, premise_errors)
+
+            # Fetch detailed service info and work orders
+            service_details = []
+            if isinstance(services, dict) and 'id' in services:
+                # Fetch detailed service info
+                details = fetch_service_details(service_id, premise_errors)
+
+                # Fetch related work orders for the service
+                if work_orders_by_service is not None:
+                    work_orders = work_orders_by_service.get(service_id, {"items": []})
+                else:
+                    work_orders = fetch_work_orders(service_id, premise_errors)
+
+                # Attach work orders to the service details
+                service_info = {
+                    "service_details": details,
+                    "work_orders": work_orders
+                }
+                service_details.append(service_info)
+            else:
+                print(f"Invalid service data for service {service_id}: {services}")
+
+            # Attach services and the premise's own customer to the premise data
+            premise_copy = premise.copy()  # Create a shallow copy to avoid circular reference
+            premise_copy['services'] = service_details
+            premise_copy['customer'] = customer_futures[customer_id].result() if customer_id in customer_futures else {}
+            if not premise_copy['customer']:
+                premise_errors.extend(customer_errors.get(customer_id, []))
+            enriched_data.append(premise_copy)
+
+            # Park premises whose fetches failed so they can be replayed without a full rerun, with
+            # the error class of the first failed request (e.g. circuit_open while a breaker is open)
+            fetch_errors = find_fetch_errors(premise_copy)
+            if fetch_errors:
+                error_class = premise_errors[0] if premise_errors else fetch_errors[0]
+                dead_letter.record_failure('enrich', error_class, {"premise": premise}, ", ".join(fetch_errors))
+            else:
+                complete.append(premise_copy)
+    finally:
+        customer_executor.shutdown(wait=True, cancel_futures=True)
+
+    if len(complete) < len(enriched_data):
+        print(f"Parked {len(enriched_data) - len(complete)} premises with failed fetches")
+    return complete
+
+# List the fetches that failed for an enriched premise. The fetch_* helpers return {} or []
+# on error, which is distinguishable from a successful (dict) response.
+def find_fetch_errors(enriched_premise):
+    errors = []
+    services = enriched_premise.get('services', [])
+    if not services:
+        errors.append('service_fetch_failed')
+    for service in services:
+        if service.get('service_details') == {}:
+            errors.append('service_details_fetch_failed')
+        if service.get('work_orders') == []:
+            errors.append('work_orders_fetch_failed')
+    if not enriched_premise.get('customer'):
+        errors.append('customer_fetch_failed')
+    return errors
+
+# Replace premises in the saved enriched data (matched by service id), appending new ones
+def merge_into_saved_data(premises, filename="enriched_premises_data.json"):
+    if store.enabled():
+        store.upsert_enriched_premises(premises)
+        return
+    try:
+        if snapshot.enabled():
+            saved_data = snapshot.read_snapshot(state_path(snapshot.ENRICHED_SNAPSHOT))
+        else:
+            with open(state_path(filename), 'r') as json_file:
+                saved_data = json.load(json_file)
+    except FileNotFoundError:
+        saved_data = []
+
+    replacements = {premise['id']: premise for premise in premises}
+    merged = [replacements.pop(premise.get('id'), premise) for premise in saved_data]
+    merged.extend(replacements.values())
+    save_data_to_file(merged, filename)
+
+# Dead letter replay handler: re-enrich one premise, merge it into the saved data and push it
+# to HubSpot. Returns True only if every fetch and the push succeeded.
+def replay_enrich(payload):
+    enriched = enrich_premises_with_services_and_customers([payload['premise']])
+    if not enriched:
+        print(f"Replay of service {payload['premise'].get('id')} still failing")
+        return False
+    enriched_premise = enriched[0]
+
+    merge_into_saved_data([enriched_premise])
+
+    from . import hub
+    return hub.push_premise(enriched_premise)
+
+# Save the enriched data to the state store (upserts) or a JSON file (overwrites the file each time)
+def save_data_to_file(data, filename="enriched_premises_data.json"):
+    if store.enabled():
+        store.upsert_enriched_premises(data)
+        return
+    if snapshot.enabled():
+        snapshot.write_snapshot(data, state_path(snapshot.ENRICHED_SNAPSHOT))
+        return
+    with open(state_path(filename), 'w') as json_file:
+        json.dump(data, json_file, indent=4)
+        print(f"Data saved to {filename}")
+
+# Load the fetched services, enrich them and save the enriched data
+# Work orders are fetched first in bulk mode: a work order can change while its service does
+# not, and the store only knows the service needs re-enriching by comparing the bulk window.
+# With push (run does this with hub.process_premises_for_hubspot), urgent premises (see
+# priority.is_urgent) are enriched, saved and pushed before the rest are enriched, so they
+# do not wait on routine work. In store mode push loads the pending premises itself;
+# otherwise it is given the premises just enriched.
+def enrich_and_save(push=None):
+    work_orders_by_service = None
+    if WORK_ORDER_FETCH_MODE == 'bulk':
+        with profiling.stage('fetch_work_orders'):
+            work_orders_by_service = fetch_work_orders_by_service(get_updated_after(HOURS))
+        if work_orders_by_service is None:
+            print("Falling back to per-service work order fetches")
+
+    with profiling.stage('load_services'):
+        premises_data = load_premises_data(work_orders_by_service=work_orders_by_service)
+
+    if not premises_data:
+        print("No premises data available or an error occurred")
+        if push and store.enabled():
+            push()  # premises left pending by an earlier run
+        return
+
+    tiers = [premises_data]
+    if push:
+        urgent = [premise for premise in premises_data if priority.is_urgent(premise, work_orders_by_service)]
+        routine = [premise for premise in premises_data if not priority.is_urgent(premise, work_orders_by_service)]
+        tiers = [tier for tier in (urgent, routine) if tier]
+        print(f"Enriching {len(urgent)} urgent premises before {len(routine)} others")
+
+    enriched_data = []
+    for tier in tiers:
+        with profiling.stage('enrich'):
+            enriched_tier = enrich_premises_with_services_and_customers(tier, work_orders_by_service)
+        enriched_data.extend(enriched_tier)
+        with profiling.stage('save_enriched'):
+            # The store upserts, so each tier is saved on its own; the files hold everything so far
+            save_data_to_file(enriched_tier if store.enabled() else enriched_data)
+        if push and store.enabled():
+            push()
+        elif push:
+            push(enriched_tier)
+    print(f"Fetched and enriched {len(enriched_data)} premises in total.")
+
+# Main function to demonstrate the API call with pagination and save enriched data to file
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enrich fetched services with service details, work orders and customers")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.profile:
+        profiling.enable(args.profile, prefix="data")
+
+    require_aex_credentials()
+
+    enrich_and_save()
+    profiling.write_results()
+
+# Run the main function
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:  # not available on Windows; only threads are serialized there
+    fcntl = None
+from .config import state_path, require_aex_credentials, require_hubspot_credentials
+
+# Failed AEX fetches and HubSpot writes are appended here (inside the network's state
+# directory), one JSON object per line
+DEAD_LETTER_FILE = os.getenv('DEAD_LETTER_FILE', 'dead_letters.jsonl')
+
+# Replay retry settings: attempts per item and the initial backoff in seconds (doubled per attempt)
+REPLAY_MAX_ATTEMPTS = int(os.getenv('DEAD_LETTER_MAX_ATTEMPTS', 5))
+REPLAY_BACKOFF_SECONDS = float(os.getenv('DEAD_LETTER_BACKOFF_SECONDS', 2))
+
+# Error classes that fail the same way until the data or the mappings change. They are recorded
+# as not replayable and skipped by replay unless their error class is asked for explicitly.
+PERMANENT_ERROR_CLASSES = {'unknown_work_order_status'}
+
+_lock = threading.Lock()
+_state = threading.local()
+
+# Hold the dead letter file exclusively, across threads and (through a .lock file next to it)
+# across processes, so a replay rewriting the file cannot drop entries another run appends
+@contextmanager
+def _locked(filename):
+    with _lock:
+        with open(filename + '.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# Identify the item a dead letter is about: the stage plus the service id (fetch, enrich and
+# contact writes), the work order id (ticket writes) or the ticket set (association batches)
+def entry_key(stage, payload):
+    if 'work_order' in payload:
+        item = f"work_order:{(payload['work_order'] or {}).get('id')}"
+    elif 'premise' in payload:
+        item = f"service:{(payload['premise'] or {}).get('id')}"
+    elif 'service' in payload:
+        item = f"service:{(payload['service'] or {}).get('id')}"
+    elif 'links' in payload:
+        item = "tickets:" + ",".join(sorted(str(ticket_id) for ticket_id in payload['links']))
+    else:
+        item = json.dumps(payload, sort_keys=True)
+    return f"{stage}/{item}"
+
+# Persist a failed item with its stage, error class and the payload needed to retry it. An item
+# that is already parked (same entry_key, e.g. a premise re-parked by every run while its fetch
+# keeps failing) has its entry replaced, keeping its id and attempt count, instead of duplicated.
+def record_failure(stage, error_class, payload, error='', filename=None):
+    if getattr(_state, 'suspended', False):
+        return None
+
+    filename = filename or state_path(DEAD_LETTER_FILE)
+    entry = {
+        "id": uuid.uuid4().hex,
+        "key": entry_key(stage, payload),
+        "stage": stage,
+        "error_class": error_class,
+        "error": str(error),
+        "payload": payload,
+        "replayable": error_class not in PERMANENT_ERROR_CLASSES,
+        "attempts": 0,
+        "failed_at": datetime.now().isoformat()
+    }
+
+    with _locked(filename):
+        entries = load_dead_letters(filename)
+        existing = next((index for index, stored in enumerate(entries)
+                         if (stored.get('key') or entry_key(stored['stage'], stored['payload'])) == entry['key']), None)
+        if existing is None:
+            with open(filename, 'a') as dead_letter_file:
+                dead_letter_file.write(json.dumps(entry) + "\n")
+        else:
+            entry['id'] = entries[existing]['id']
+            entry['attempts'] = entries[existing].get('attempts', 0)
+            entries[existing] = entry
+            _write_dead_letters(entries, filename)
+
+    logging.warning(f"Recorded dead letter {entry['id']} ({stage}/{error_class})"
+                    + (" replacing the earlier entry for the same item" if existing is not None else ""))
+    return entry['id']
+
+# Load all dead letters, optionally filtered by stage
+def load_dead_letters(filename=None, stage=None):
+    filename = filename or state_path(DEAD_LETTER_FILE)
+    entries = []
+    try:
+        with open(filename, 'r') as dead_letter_file:
+            for line in dead_letter_file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    logging.error(f"Skipping unreadable dead letter line in '{filename}': {e}")
+    except FileNotFoundError:
+        return []
+
+    if stage:
+        entries = [entry for entry in entries if entry.get('stage') == stage]
+    return entries
+
+# Overwrite the dead letter file with the given entries (the caller holds _locked)
+def _write_dead_letters(entries, filename):
+    temporary = filename + '.tmp'
+    with open(temporary, 'w') as dead_letter_file:
+        for entry in entries:
+            dead_letter_file.write(json.dumps(entry) + "\n")
+    os.replace(temporary, filename)
+
+# Overwrite the dead letter file with the given entries
+def save_dead_letters(entries, filename=None):
+    filename = filename or state_path(DEAD_LETTER_FILE)
+    with _locked(filename):
+        _write_dead_letters(entries, filename)
+
+# Stop recording new dead letters inside this block (used while a replay retries an item,
+# so a failed attempt does not enqueue a duplicate of the entry being replayed)
+@contextmanager
+def suspended():
+    previous = getattr(_state, 'suspended', False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+# Map each stage to the function that retries one of its payloads. Handlers return a truthy
+# value on success. Modules are imported lazily so replaying one stage only needs that
+# stage's credentials, which are checked before the first retry.
+def get_replay_handler(stage):
+    if stage == 'fetch':
+        require_aex_credentials()
+        from . import customers
+        return customers.replay_fetch
+    if stage == 'enrich':
+        require_aex_credentials()
+        require_hubspot_credentials()
+        from . import data
+        return data.replay_enrich
+    if stage.startswith('hubspot_'):
+        require_hubspot_credentials()
+    if stage == 'hubspot_contact':
+        from . import hub
+        return hub.replay_contact
+    if stage == 'hubspot_ticket':
+        from . import hub
+        return hub.replay_ticket
+    if stage == 'hubspot_associations':
+        from . import hub
+        return hub.replay_associations
+    raise ValueError(f"No replay handler for dead letter stage '{stage}'")
+
+# Retry a single dead letter with exponential backoff; returns (succeeded, last_error)
+def replay_entry(entry, handler, max_attempts=REPLAY_MAX_ATTEMPTS, backoff=REPLAY_BACKOFF_SECONDS):
+    last_error = entry.get('error', '')
+    for attempt in range(max_attempts):
+        if attempt:
+            time.sleep(backoff * (2 ** (attempt - 1)))
+        try:
+            with suspended():
+                if handler(entry['payload']):
+                    return True, ''
+            last_error = "handler reported failure"
+        except Exception as e:
+            last_error = str(e)
+        logging.warning(f"Replay attempt {attempt + 1}/{max_attempts} failed for dead letter {entry['id']}: {last_error}")
+    return False, last_error
+
+# Entries recorded before the replayable flag existed fall back to their error class
+def is_replayable(entry):
+    return entry.get('replayable', entry.get('error_class') not in PERMANENT_ERROR_CLASSES)
+
+# Retry the stored dead letters (optionally only one stage or error class). Succeeded items
+# are removed from the store; items that still fail are kept with their attempt count updated.
+# Items that are not replayable are skipped unless error_class names them. The file is re-read
+# under the lock before it is rewritten, so dead letters recorded meanwhile are kept.
+def replay(stage=None, error_class=None, max_attempts=REPLAY_MAX_ATTEMPTS, backoff=REPLAY_BACKOFF_SECONDS, filename=None):
+    filename = filename or state_path(DEAD_LETTER_FILE)
+    entries = load_dead_letters(filename)
+    recovered_ids, updated = set(), {}
+    replayed, skipped = 0, 0
+
+    for entry in entries:
+        if (stage and entry.get('stage') != stage) or (error_class and entry.get('error_class') != error_class):
+            continue
+        if not is_replayable(entry) and error_class != entry.get('error_class'):
+            skipped += 1
+            continue
+
+        replayed += 1
+        try:
+            handler = get_replay_handler(entry.get('stage'))
+        except ValueError as e:
+            logging.error(str(e))
+            continue
+
+        succeeded, last_error = replay_entry(entry, handler, max_attempts, backoff)
+        if succeeded:
+            recovered_ids.add(entry['id'])
+            logging.info(f"Dead letter {entry['id']} ({entry['stage']}/{entry['error_class']}) replayed successfully")
+        else:
+            entry['attempts'] = entry.get('attempts', 0) + max_attempts
+            entry['error'] = last_error
+            entry['last_replayed_at'] = datetime.now().isoformat()
+            updated[entry['id']] = entry
+
+    with _locked(filename):
+        current = load_dead_letters(filename)
+        _write_dead_letters([updated.get(entry['id'], entry) for entry in current if entry['id'] not in recovered_ids], filename)
+
+    recovered = len(recovered_ids)
+    if skipped:
+        logging.info(f"Skipped {skipped} dead letters with permanent errors; replay them with --error-class once fixed")
+    logging.info(f"Replayed {replayed} dead letters: {recovered} recovered, {replayed - recovered} still failing")
+    return recovered, replayed - recovered
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Inspect and replay failed AEX fetches and HubSpot writes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="List stored dead letters")
+    list_parser.add_argument("--stage")
+
+    replay_parser = subparsers.add_parser("replay", help="Retry stored dead letters with backoff")
+    replay_parser.add_argument("--stage")
+    replay_parser.add_argument("--error-class")
+    replay_parser.add_argument("--max-attempts", type=int, default=REPLAY_MAX_ATTEMPTS)
+    replay_parser.add_argument("--backoff", type=float, default=REPLAY_BACKOFF_SECONDS)
+
+    args = parser.parse_args()
+    if args.command == "list":
+        for entry in load_dead_letters(stage=args.stage):
+            print(f"{entry['id']}  {entry['failed_at']}  {entry['stage']}/{entry['error_class']}  attempts={entry.get('attempts', 0)}{'' if is_replayable(entry) else '  (not replayable)'}  {entry.get('error', '')}")
+    else:
+        replay(args.stage, args.error_class, args.max_attempts, args.backoff)
+
+if __name__ == "__main__":
+    main()
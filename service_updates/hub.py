@@ -0,0 +1,1149 @@
+import os
+import json
+from datetime import datetime
+import re
+import logging
+import time
+import argparse
+from . import dead_letter
+from . import store
+from . import snapshot
+from . import profiling
+from . import api
+from .config import current_network, state_path, require_hubspot_credentials
+
+# Defers json.dumps of a logged payload until the log record is actually emitted, so
+# disabled debug logging costs nothing
+class LazyJson:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        return json.dumps(self.payload, indent=2)
+
+# Load enriched data from the state store (only premises changed since their last push), a snapshot or a JSON file
+# A push sends every enriched premise, so a snapshot is decoded in full here; single records
+# are looked up through snapshot.SnapshotReader instead
+def load_enriched_data(filename=None):
+    if store.enabled():
+        return store.load_pending_premises()
+    if snapshot.enabled():
+        try:
+            return snapshot.read_snapshot(state_path(snapshot.ENRICHED_SNAPSHOT))
+        except FileNotFoundError:
+            logging.error(f"Enriched snapshot '{state_path(snapshot.ENRICHED_SNAPSHOT)}' not found.")
+            return []
+    filename = state_path(filename or os.getenv('ENRICHED_DATA_FILE', 'enriched_premises_data.json'))
+    try:
+        with open(filename, 'r') as json_file:
+            return json.load(json_file)
+    except FileNotFoundError:
+        logging.error(f"Enriched data file '{filename}' not found.")
+        return []
+    except json.JSONDecodeError as e:
+        logging.error(f"Error decoding JSON from '{filename}': {e}")
+        return []
+
+# Load sales rep data from CSV file (the current network's own file, if it configures one)
+def load_sales_rep_data(filename=None):
+    import pandas as pd  # Deferred: pandas is only needed once a push starts
+
+    filename = filename or current_network().sales_rep_file or os.getenv('SALES_REP_DATA_FILE', 'id.csv')
+    try:
+        return pd.read_csv(filename)
+    except FileNotFoundError:
+        logging.error(f"Sales rep data file '{filename}' not found.")
+        return pd.DataFrame()
+    except pd.errors.EmptyDataError as e:
+        logging.error(f"Error reading CSV from '{filename}': {e}")
+        return pd.DataFrame()
+
+# Load ticket types data from JSON file
+def load_ticket_types(filename=None):
+    filename = filename or os.getenv('TICKET_TYPES_FILE', 'ticket_types.json')
+    try:
+        with open(filename, 'r') as json_file:
+            return json.load(json_file)
+    except FileNotFoundError:
+        logging.error(f"Ticket types file '{filename}' not found.")
+        return {}
+    except json.JSONDecodeError as e:
+        logging.error(f"Error decoding JSON from '{filename}': {e}")
+        return {}
+
+# Helper function to format dates to YYYY-MM-DD
+def format_date(date_str):
+    if date_str:
+        try:
+            # Convert date string to datetime object and format to YYYY-MM-DD
+            return datetime.fromisoformat(date_str).strftime('%Y-%m-%d')
+        except ValueError:
+            return None  # If date format is invalid, return None
+    return None
+
+# Helper function to convert date to Unix timestamp (milliseconds)
+def format_date_to_timestamp(date_str):
+    if date_str:
+        try:
+            # Convert date string to datetime object and get Unix timestamp in milliseconds
+            return int(datetime.fromisoformat(date_str).timestamp() * 1000)
+        except ValueError:
+            return None  # If date format is invalid, return None
+    return None
+
+# Define installation and service pipeline stages
+# Define installation and service pipeline stages
+installation_pipeline_stages = {
+    "Rejection": 2,
+    "closed - rejection - duplication": 2,
+    "Closed - rejection - duplication": 2,
+    "closed - rejected": 2,
+    "Fiber Ready": 3,
+    "Active Refusal": 4,
+    "SALES - Active Refusal": 4,
+    "Passive Refusal": 258799956,
+    "Pre Order": 258799957,
+    "New Order": 258799958,
+    "NID Relocate": 258799960,
+    "Civil Drop": 258799961,
+    "Optical Drop": 258799962,
+    "Soft Blockage": 258799963,
+    "Hard Blockage": 258799964,
+    "NCCH": 258799965,
+    "Full Handover": 258799966,
+    "NID Installation Complete": 258799967,
+    "ISP Scheduled": 258799968,
+    "ISP Complete": 258799969,
+    "Pending Auto Configuration": 258799970,
+    "pending configuration": 258799970,
+    "Auto Configuration Failed": 258799971,
+    "Activation Complete": 258799972,
+    "Not Actionable": 258799973,
+    "Installation": 258799974,
+    "Provisioning": 267644843,
+    "provisioning failed": 267644843,
+    "Provisioned": 267644843,
+    "Other": 267644850,
+    "NID Installation": 267644851,
+    "closed - nid - installation complete": 267644851,
+    "Service Activation (without installation)": 267644856,
+    "L3 Configuration": 267644930,
+    "configured": 267644930,
+    "Relocation": 267644931,
+    "Abandoned": 954945896
+}
+
+service_pipeline_stages = {
+    "Cancellation": 267644932,
+    "Cancellation in Progress": 267644932,
+    "Cancellation pending": 267644932,
+    "Cancellation Pending": 267644932,
+    "cancelled": 267644932,
+    "Cancelled": 267644932,
+    "Change Service": 267644933,
+    "Service change": 267644933,
+    "service change approved": 954945906,
+    "Service Change Approved": 954945906,
+    "Change Service": 267644933,
+    "Fiber Break": 267644934,
+    "Service Down": 267644935,
+    "Light Levels": 267647763,
+    "Power Down": 267647764,
+    "Maintenance": 267647765,
+    "Swapout Device": 267647766,
+    "Recover Device": 267647767,
+    "Deprovisioning": 267647768,
+    "Speed Test": 267647769,
+    "Change Service Provider": 267647770,
+    "Fault": 267647771,
+    "service change approved": 954945906,
+    "Change Service": 954945906,
+    "rejected": 955026021,
+    "deprovisioned": 954733986
+}
+
+# Installation and service stage maps for the current network: the defaults above with the
+# network's own overrides applied
+def pipeline_stages():
+    network = current_network()
+    return (
+        {**installation_pipeline_stages, **network.installation_pipeline_stages},
+        {**service_pipeline_stages, **network.service_pipeline_stages}
+    )
+
+_network_stage_tables = {}
+
+# Lowercased installation and service stage maps of the current network, built once per network.
+# Ticket routing and priority.py both resolve work order statuses through these.
+def stage_tables():
+    network = current_network()
+    if network.name not in _network_stage_tables:
+        installation_stages, service_stages = pipeline_stages()
+        _network_stage_tables[network.name] = (
+            {k.lower(): v for k, v in installation_stages.items()},
+            {k.lower(): v for k, v in service_stages.items()}
+        )
+    return _network_stage_tables[network.name]
+
+# Resolve a work order status to its ("service" or "installation", stage id), case-insensitively;
+# None for statuses in neither map
+def stage_for_status(status):
+    lower_installation_stages, lower_service_stages = stage_tables()
+    status_lower = (status or '').strip().lower()
+    if status_lower in lower_service_stages:
+        return ("service", lower_service_stages[status_lower])
+    if status_lower in lower_installation_stages:
+        return ("installation", lower_installation_stages[status_lower])
+    return None
+
+# Number of premises flattened into one DataFrame batch by the payload transform
+TRANSFORM_BATCH_SIZE = int(os.getenv('TRANSFORM_BATCH_SIZE', 500))
+
+# Apply a scalar function once per distinct value of a column and map the results back.
+# Dates, statuses and sales channel ids repeat heavily across a batch, so this keeps the exact
+# semantics of the scalar helpers (e.g. naive dates in local time) at a per-distinct-value cost.
+def _map_unique(series, func):
+    import pandas as pd
+
+    lookup = pd.Series({value: func(value) for value in series.dropna().unique()}, dtype=object)
+    mapped = series.map(lookup).astype(object)
+    return mapped.where(mapped.notna(), None)
+
+# Build a sales_channel_id -> Sales_Channel_Text lookup (first row wins, as with .iloc[0])
+def _sales_rep_lookup(sales_rep_data):
+    if sales_rep_data.empty:
+        return {}
+    reps = sales_rep_data.drop_duplicates('sales_channel_id')
+    return dict(zip(reps['sales_channel_id'].tolist(), reps['Sales_Channel_Text'].tolist()))
+
+# Walk the nested enriched structure of one premise once and pull out the flat fields the
+# contact and ticket payloads need
+def _flatten_premise(premise):
+    customer = premise.get('customer') or {}
+    services = premise.get('services') or []
+
+    # Contact address and status date come from the first service with an updated_at
+    contact_premise, contact_updated_at = {}, None
+    for service in services:
+        service_details = service.get('service_details', None)
+        if service_details is None:
+            logging.warning(f"Missing service_details for premise {premise.get('id', 'Unknown ID')}. Skipping.")
+            continue
+        full_service = service_details.get('full_service', {})
+        contact_premise = full_service.get('premise', {})
+        contact_updated_at = full_service.get('service', {}).get('updated_at')
+        if contact_updated_at:
+            break
+
+    # Ticket address and product come from the first service; updates fall back to the
+    # first service that has a product name
+    first_full_service = ((services[0].get('service_details') or {}).get('full_service') or {}) if services else {}
+    ticket_premise = first_full_service.get('premise', {})
+    update_product = ''
+    for service in services:
+        update_product = ((service.get('service_details') or {}).get('full_service') or {}).get('isp_product', {}).get('name', '')
+        if update_product:
+            break
+
+    return {
+        "service_id": premise.get('id', ''),
+        "premise_id": premise.get('premise_id', ''),
+        "customer_id": customer.get('id', ''),
+        "firstname": customer.get('first_name', ''),
+        "lastname": customer.get('last_name', ''),
+        "email": customer.get('email', ''),
+        "phone": customer.get('mobile_number', ''),
+        "address": f"{contact_premise.get('street_number', '')} {contact_premise.get('street_name', '')}",
+        "city": contact_premise.get('city', ''),
+        "state": contact_premise.get('province', ''),
+        "zip": contact_premise.get('postal_code', ''),
+        "latitude": contact_premise.get('lat', ''),
+        "longitude": contact_premise.get('lon', ''),
+        "contact_updated_at": contact_updated_at,
+        "sales_rep_id": premise.get('sales_channel_id'),
+        "status": premise.get('status', ''),
+        "ticket_status": premise.get('status', 'Unknown Status'),
+        "street_address": f"{ticket_premise.get('street_number', '')} {ticket_premise.get('street_name', '')}",
+        "create_product": first_full_service.get('isp_product', {}).get('name', 'Unknown Product'),
+        "update_product": update_product
+    }
+
+# Flatten the work orders of one premise into rows keyed by service id
+def _flatten_work_orders(premise):
+    rows = []
+    for service in premise.get('services') or []:
+        work_orders_data = service.get('work_orders') if isinstance(service, dict) else None
+        if not isinstance(work_orders_data, dict):
+            continue
+        for work_order in work_orders_data.get('items', []):
+            if not isinstance(work_order, dict) or not work_order:
+                continue
+            rows.append({
+                "service_id": premise.get('id', ''),
+                "work_order_id": work_order.get('id', ''),
+                "work_order_status": (work_order.get('status') or '').strip(),
+                "create_content": work_order.get('description', 'No Description Provided'),
+                "update_content": work_order.get('description', ''),
+                "created_at": work_order.get('created_at', ''),
+                "schedule_date": work_order.get('schedule_date', ''),
+                "completed_date": work_order.get('completed_date', '')
+            })
+    return rows
+
+# Columnar transform: flatten a batch of enriched premises into DataFrames, resolve dates,
+# pipeline stages and sales reps per column, and emit the HubSpot property dicts in bulk.
+# Returns (contact payloads keyed by service id, ticket payloads keyed by (service id, work order id)).
+# Each ticket payload holds the pipeline routing plus the "create" and "update" property dicts;
+# pipeline_id is None for unknown work order statuses.
+def build_hubspot_payloads(premises, sales_rep_data):
+    import pandas as pd
+
+    premises = [premise for premise in premises if premise]
+    if not premises:
+        return {}, {}
+
+    premise_df = pd.DataFrame([_flatten_premise(premise) for premise in premises], dtype=object)
+    # Missing values (e.g. a NaN sales channel id) go out as null; NaN is not valid JSON for HubSpot
+    premise_df = premise_df.where(premise_df.notna(), None)
+    sales_reps = _sales_rep_lookup(sales_rep_data)
+    premise_df['contact_sales_rep'] = _map_unique(premise_df['sales_rep_id'], lambda rep_id: sales_reps.get(rep_id, 'No Sales Agent Selected'))
+    premise_df['contact_sales_rep'] = premise_df['contact_sales_rep'].where(premise_df['contact_sales_rep'].notna(), 'No Sales Agent Selected')
+    premise_df['update_sales_rep'] = _map_unique(premise_df['sales_rep_id'], lambda rep_id: sales_reps.get(rep_id, ''))
+    premise_df['update_sales_rep'] = premise_df['update_sales_rep'].where(premise_df['update_sales_rep'].notna(), '')
+    premise_df['service_status_date'] = _map_unique(premise_df['contact_updated_at'], format_date_to_unix)
+
+    contact_payloads = {}
+    for row in premise_df.to_dict('records'):
+        contact_payloads[row['service_id']] = {
+            "properties": {
+                "firstname": row['firstname'],
+                "lastname": row['lastname'],
+                "email": row['email'],
+                "phone": row['phone'],
+                "address": row['address'],
+                "city": row['city'],
+                "state": row['state'],
+                "zip": row['zip'],
+                "aex_id": row['premise_id'],
+                "latitude": row['latitude'],
+                "longitude": row['longitude'],
+                "service_status_date": row['service_status_date'],
+                "sales_rep": row['contact_sales_rep'],
+                "sales_rep_id": row['sales_rep_id'],
+                "service_status": row['status']
+            }
+        }
+
+    work_order_rows = [row for premise in premises for row in _flatten_work_orders(premise)]
+    if not work_order_rows:
+        return contact_payloads, {}
+
+    ticket_df = pd.DataFrame(work_order_rows, dtype=object).merge(
+        premise_df.drop_duplicates(subset='service_id', keep='last'), on='service_id', how='left'
+    )
+
+    # Pipeline routing: statuses resolve case-insensitively through the same stage maps as
+    # stage_for_status (and so priority.py), service pipeline first
+    lower_installation_stages, lower_service_stages = stage_tables()
+    status_lower = ticket_df['work_order_status'].str.lower()
+    is_service = status_lower.isin(list(lower_service_stages))
+    is_installation = ~is_service & status_lower.isin(list(lower_installation_stages))
+    ticket_df['pipeline_id'] = None
+    ticket_df.loc[is_installation, 'pipeline_id'] = "0"  # Example pipeline ID for installation
+    ticket_df.loc[is_service, 'pipeline_id'] = "160077657"  # Service pipeline ID
+    installation_stage = _map_unique(status_lower, lower_installation_stages.get)
+    service_stage = _map_unique(status_lower, lower_service_stages.get)
+    ticket_df['pipeline_stage_id'] = service_stage.where(is_service, installation_stage.where(is_installation, None))
+
+    for column in ('created_at', 'schedule_date', 'completed_date'):
+        ticket_df[f"{column}_ts"] = _map_unique(ticket_df[column], format_date_to_timestamp)
+
+    ticket_payloads = {}
+    for row in ticket_df.to_dict('records'):
+        subject = f"{row['street_address']} - {row['work_order_status']}"
+        ticket_payloads[(row['service_id'], row['work_order_id'])] = {
+            "work_order_status": row['work_order_status'],
+            "pipeline_id": row['pipeline_id'],
+            "create": {
+                "subject": subject,
+                "content": row['create_content'],
+                "hs_pipeline": row['pipeline_id'],
+                "hs_pipeline_stage": row['pipeline_stage_id'],
+                "aex_work_order_id": row['work_order_id'],
+                "work_order_id1": row['work_order_id'],
+                "hubspot_owner_id": None,
+                "premise_id": row['premise_id'],
+                "customer_id": row['customer_id'],
+                "createdate": row['created_at_ts'],
+                "sales_rep": row['contact_sales_rep'],
+                "sales_rep_id": row['sales_rep_id'],
+                "service_status": row['ticket_status'],
+                "schedule_date": row['schedule_date_ts'],
+                "closed_date": row['completed_date_ts'],
+                "service_id": row['service_id'],
+                "product": row['create_product']
+            },
+            "update": {
+                "subject": subject,
+                "content": row['update_content'],
+                "hs_pipeline_stage": row['pipeline_stage_id'],
+                "work_order_id1": row['work_order_id'],
+                "hubspot_owner_id": None,
+                "premise_id": row['premise_id'],
+                "customer_id": row['customer_id'],
+                "createdate": row['created_at_ts'],
+                "aex_create_date": row['created_at_ts'],
+                "sales_rep": row['update_sales_rep'],
+                "sales_rep_id": row['sales_rep_id'],
+                "service_status": row['status'],
+                "schedule_date": row['schedule_date_ts'],
+                "closed_date": row['completed_date_ts'],
+                "service_id": row['service_id'],
+                "product": row['update_product']
+            }
+        }
+
+    return contact_payloads, ticket_payloads
+
+# Create or update a contact in HubSpot and return the contact ID. contact_data is normally
+# prebuilt by build_hubspot_payloads for the whole batch; it is built here when omitted.
+def create_or_update_contact_in_hubspot(premise, customer, sales_rep_data, contact_data=None):
+    if not premise or not customer:
+        logging.warning("Premise or customer data is None, skipping this premise.")
+        return
+
+    if contact_data is None:
+        contact_payloads, _ = build_hubspot_payloads([premise], sales_rep_data)
+        contact_data = contact_payloads[premise.get('id', '')]
+
+    email = customer.get('email', '')
+    aex_id = premise.get('premise_id', '')
+    existing_contact_id = find_existing_contact_by_email_or_aex_id(email, aex_id)
+
+    if existing_contact_id and store.enabled():
+        store.save_hubspot_id('contact', aex_id, existing_contact_id)
+
+    if existing_contact_id:
+        # Update the existing contact
+        updated_contact_id = update_contact(existing_contact_id, contact_data)
+        if not updated_contact_id:
+            dead_letter.record_failure('hubspot_contact', 'contact_update_failed', {"premise": premise},
+                                       f"Error updating contact {existing_contact_id}")
+            return existing_contact_id
+
+        # A 409 merge means the contact now lives under a different ID; link tickets to that one
+        if updated_contact_id != existing_contact_id and store.enabled():
+            store.save_hubspot_id('contact', aex_id, updated_contact_id)
+        return updated_contact_id
+    else:
+        # Create a new contact
+        url = "https://api.hubapi.com/crm/v3/objects/contacts"
+        response = api.hubspot_post(url, json=contact_data)
+
+        if response.status_code in (200, 201):
+            logging.info(f"Contact created successfully for AEX ID: {aex_id}")
+            contact_id = response.json().get('id')
+            if contact_id and store.enabled():
+                store.save_hubspot_id('contact', aex_id, contact_id)
+            return contact_id
+        else:
+            logging.error(f"Error creating contact: {response.text}")
+            dead_letter.record_failure('hubspot_contact', 'contact_create_failed', {"premise": premise}, response.text)
+            return None
+
+# Helper function to format dates to YYYY-MM-DD
+def format_date(date_str):
+    if date_str:
+        try:
+            # Convert date string to datetime object and format to YYYY-MM-DD
+            return datetime.fromisoformat(date_str).strftime('%Y-%m-%d')
+        except ValueError:
+            return None  # If date format is invalid, return None
+    return None
+
+# Helper function to convert date to Unix timestamp (milliseconds)
+def format_date_to_unix(date_str, in_milliseconds=True):
+    if date_str:
+        try:
+            # Parse the date string with timezone info
+            dt = datetime.fromisoformat(date_str)
+            # Convert to Unix timestamp
+            unix_timestamp = dt.timestamp()
+            # Convert to milliseconds if required
+            return int(unix_timestamp * 1000) if in_milliseconds else int(unix_timestamp)
+        except ValueError:
+            logging.error(f"Invalid date format: {date_str}")
+            return None  # Return None for invalid date formats
+    return None
+
+# Update an existing contact by ID; returns the ID that was actually updated (which differs
+# from contact_id after a 409 conflict retry), or None on failure
+def update_contact(contact_id, contact_data):
+    url = f"https://api.hubapi.com/crm/v3/objects/contacts/{contact_id}"
+    response = api.hubspot_patch(url, json=contact_data)
+
+    if response.status_code == 200:
+        logging.info(f"Contact {contact_id} updated successfully.")
+        return contact_id
+    else:
+        logging.error(f"Error updating contact {contact_id}: {response.text}")
+        if response.status_code == 409:  # Conflict: Contact already exists
+            existing_contact_id = extract_existing_contact_id(response.text)
+            if existing_contact_id and existing_contact_id != contact_id:
+                logging.info(f"Conflict detected. Retrying update with existing contact ID: {existing_contact_id}")
+                return update_contact(existing_contact_id, contact_data)
+        return None
+
+# Extract the existing contact ID from the conflict error message
+def extract_existing_contact_id(error_message):
+    match = re.search(r"Existing ID: (\d+)", error_message)
+    if match:
+        return match.group(1)
+    return None
+
+# Search for an existing contact by email or AEX ID
+def find_existing_contact_by_email_or_aex_id(email, aex_id):
+    url = "https://api.hubapi.com/crm/v3/objects/contacts/search"
+    query = {
+        "filterGroups": [
+            {
+                "filters": [
+                    {
+                        "propertyName": "email",
+                        "operator": "EQ",
+                        "value": email
+                    }
+                ]
+            },
+            {
+                "filters": [
+                    {
+                        "propertyName": "aex_id",
+                        "operator": "EQ",
+                        "value": aex_id
+                    }
+                ]
+            }
+        ]
+    }
+    
+    response = api.hubspot_post(url, json=query)
+    
+    if response.status_code == 200:
+        try:
+            data = response.json()
+            if data.get('results'):
+                return data['results'][0].get('id')  # Return the existing contact ID
+        except ValueError:
+            logging.error(f"Invalid JSON response: {response.text}")
+    else:
+        logging.error(f"Error finding contact in HubSpot by email or AEX ID: {response.text}")
+    return None
+
+# Create or update tickets in HubSpot for a contact; returns the ticket ID on success.
+# Failures are recorded as dead letters so they can be replayed on their own.
+# ticket_payload is normally prebuilt by build_hubspot_payloads; it is built here when omitted.
+def create_or_update_tickets_for_contact(contact_id, work_order, ticket_types, premise, customer, service, sales_rep_data, ticket_payload=None):
+    if not work_order:
+        logging.warning("Work order data is None, skipping ticket creation.")
+        return
+
+    dead_letter_payload = {"contact_id": contact_id, "work_order": work_order, "premise": premise}
+
+    try:
+        work_order_id = work_order.get('id', '')
+        if ticket_payload is None:
+            _, ticket_payloads = build_hubspot_payloads([premise], sales_rep_data)
+            ticket_payload = ticket_payloads[(premise.get('id', ''), work_order_id)]
+
+        work_order_status = ticket_payload['work_order_status']
+        if ticket_payload['pipeline_id'] is None:
+            logging.error(f"Unknown work order status: '{work_order_status}'. Skipping ticket creation.")
+            dead_letter.record_failure('hubspot_ticket', 'unknown_work_order_status', dead_letter_payload,
+                                       f"Unknown work order status: '{work_order_status}'")
+            return
+
+        # Check for existing ticket
+        existing_ticket_id = find_existing_ticket_by_work_order_id(work_order_id)
+
+        # Prepare ticket data
+        ticket_data = {
+            "properties": ticket_payload['create'],
+            "associations": [
+                {
+                    "to": {
+                        "id": contact_id
+                    },
+                    "types": [
+                        {
+                            "associationCategory": "USER_DEFINED",
+                            "associationTypeId": 81  # Ticket-to-contact association type ID
+                        }
+                    ]
+                }
+            ]
+        }
+
+        # Create or update ticket
+        if existing_ticket_id:
+            logging.info(f"Ticket already exists for work order {work_order_id}. Updating existing ticket.")
+            if store.enabled():
+                store.save_hubspot_id('ticket', work_order_id, existing_ticket_id)
+            if update_ticket(existing_ticket_id, work_order, premise, customer, service, sales_rep_data, ticket_payload['update']):
+                return existing_ticket_id
+            dead_letter.record_failure('hubspot_ticket', 'ticket_update_failed', dead_letter_payload,
+                                       f"Error updating ticket {existing_ticket_id}")
+        else:
+            url = "https://api.hubapi.com/crm/v3/objects/tickets"
+            response = api.hubspot_post(url, json=ticket_data)
+            if response.status_code in (200, 201):
+                logging.info(f"Ticket created successfully for work order {work_order_id} and contact {contact_id}")
+                ticket_id = response.json().get('id')
+                if ticket_id and store.enabled():
+                    store.save_hubspot_id('ticket', work_order_id, ticket_id)
+                return ticket_id
+            else:
+                logging.error(f"Error creating ticket for work order {work_order_id}: {response.text}")
+                dead_letter.record_failure('hubspot_ticket', 'ticket_create_failed', dead_letter_payload, response.text)
+
+    except Exception as e:
+        logging.error(f"An error occurred during ticket creation: {e}")
+        dead_letter.record_failure('hubspot_ticket', api.error_class(e), dead_letter_payload, e)
+
+def find_existing_ticket_by_work_order_id(work_order_id):
+    """Checks if a ticket with the given `aex_work_order_id` already exists."""
+    url = f"https://api.hubapi.com/crm/v3/objects/tickets/search"
+    search_data = {
+        "filterGroups": [
+            {
+                "filters": [
+                    {
+                        "propertyName": "work_order_id1",
+                        "operator": "EQ",
+                        "value": work_order_id
+                    }
+                ]
+            }
+        ],
+        "properties": ["hs_object_id"]
+    }
+    response = api.hubspot_post(url, json=search_data)
+
+    if response.status_code == 200:
+        data = response.json()
+        if data.get("total", 0) > 0:
+            return data["results"][0]["id"]
+    return None
+
+# Update an existing ticket by ID; returns True on success. properties is normally the prebuilt
+# "update" payload from build_hubspot_payloads; it is built here when omitted.
+def update_ticket(ticket_id, work_order, premise, customer, service, sales_rep_data, properties=None):
+    url = f"https://api.hubapi.com/crm/v3/objects/tickets/{ticket_id}"
+
+    if properties is None:
+        _, ticket_payloads = build_hubspot_payloads([premise], sales_rep_data)
+        ticket_payload = ticket_payloads[(premise.get('id', ''), work_order.get('id', ''))]
+        if ticket_payload['pipeline_id'] is None:
+            logging.error(f"Unknown work order status: '{ticket_payload['work_order_status']}'. Skipping ticket creation.")
+            return False
+        properties = ticket_payload['update']
+
+    ticket_data = {"properties": properties}
+
+    # Log the ticket data being sent
+    logging.info("Updating Ticket Data: %s", LazyJson(ticket_data))
+
+    response = api.hubspot_patch(url, json=ticket_data)
+
+    if response.status_code == 200:
+        logging.info(f"Ticket {ticket_id} updated successfully.")
+        return True
+    else:
+        logging.error(f"Error updating ticket {ticket_id}: {response.text}")
+        return False
+
+# Search for an existing ticket by work_order_id, premise_id, and contact_id
+def find_existing_ticket_by_work_order_and_contact(work_order_id, premise_id, contact_id):
+    url = "https://api.hubapi.com/crm/v3/objects/tickets/search"
+    query = {
+        "filterGroups": [
+            {
+                "filters": [
+                    {
+                        "propertyName": "work_order_id1",  # Ensure this matches the exact custom property name in HubSpot
+                        "operator": "EQ",
+                        "value": work_order_id
+                    }
+                ]
+            },
+            {
+                "filters": [
+                    {
+                        "propertyName": "premise_id",
+                        "operator": "EQ",
+                        "value": premise_id
+                    },
+                    {
+                        "propertyName": "associations.contact",
+                        "operator": "EQ",
+                        "value": contact_id
+                    }
+                ]
+            }
+        ]
+    }
+
+    logging.info(f"Searching for existing ticket with work_order_id: {work_order_id}, premise_id: {premise_id}, contact_id: {contact_id}")
+    response = api.hubspot_post(url, json=query)
+
+    if response.status_code == 200:
+        try:
+            data = response.json()
+            logging.info("Search response data: %s", LazyJson(data))  # Log the response data for debugging
+            if data.get('results'):
+                ticket_id = data['results'][0].get('id')
+                logging.info(f"Found existing ticket with ID: {ticket_id} for work order ID: {work_order_id}")
+                return ticket_id  # Return the existing ticket ID
+        except ValueError:
+            logging.error(f"Invalid JSON response: {response.text}")
+    else:
+        logging.error(f"Error finding ticket in HubSpot by work_order_id, premise ID, and contact ID: {response.text}")
+
+    logging.info("No existing ticket found. Proceeding with ticket creation.")
+    return None
+
+# Reconcile ticket<->contact associations after the push (set RECONCILE_ASSOCIATIONS=false to skip)
+RECONCILE_ASSOCIATIONS = os.getenv('RECONCILE_ASSOCIATIONS', 'true').lower() == 'true'
+
+# HubSpot batch association endpoints accept at most 100 inputs per call
+ASSOCIATION_BATCH_SIZE = 100
+
+# Ticket-to-contact association type the integration creates and owns
+TICKET_CONTACT_ASSOCIATION_TYPE = {
+    "associationCategory": "USER_DEFINED",
+    "associationTypeId": 81
+}
+
+def _is_integration_link(association_type):
+    return (association_type.get('category') == TICKET_CONTACT_ASSOCIATION_TYPE['associationCategory']
+            and association_type.get('typeId') == TICKET_CONTACT_ASSOCIATION_TYPE['associationTypeId'])
+
+# Read the contacts currently associated to each ticket through the batch associations read API.
+# Returns {ticket_id: {contact_id: True if the link carries the integration's label}}, or None on error.
+def read_ticket_contact_associations(ticket_ids):
+    url = "https://api.hubapi.com/crm/v4/associations/tickets/contacts/batch/read"
+    response = api.hubspot_post(url, json={"inputs": [{"id": ticket_id} for ticket_id in ticket_ids]})
+
+    # 207 Multi-Status is returned when some tickets have no associations at all
+    if response.status_code not in (200, 207):
+        logging.error(f"Error reading ticket associations: {response.text}")
+        return None
+
+    associations = {ticket_id: {} for ticket_id in ticket_ids}
+    for result in response.json().get('results', []):
+        ticket_id = str(result.get('from', {}).get('id'))
+        for target in result.get('to', []):
+            labelled = any(_is_integration_link(association_type) for association_type in target.get('associationTypes', []))
+            associations.setdefault(ticket_id, {})[str(target.get('toObjectId'))] = labelled
+    return associations
+
+# Send one batch association write; returns True on success
+def write_ticket_contact_associations(action, inputs):
+    if not inputs:
+        return True
+    url = f"https://api.hubapi.com/crm/v4/associations/tickets/contacts/batch/{action}"
+    response = api.hubspot_post(url, json={"inputs": inputs})
+    if response.status_code in (200, 201, 204):
+        logging.info(f"Association batch {action} succeeded for {len(inputs)} links.")
+        return True
+    logging.error(f"Error in association batch {action}: {response.text}")
+    return False
+
+# Compare the expected ticket -> contact links against HubSpot and fix the differences in batches:
+# missing links are created, and stale links are archived. A link to another contact is stale only
+# when it carries the integration's label or the contact is one the integration recorded in the
+# store; contacts linked by users or other integrations are left alone. Stale links are archived
+# entirely (batch/archive removes every association type; labels/archive would leave the default one).
+# Returns True if every batch was reconciled.
+def reconcile_ticket_associations(expected_links):
+    ticket_ids = list(expected_links)
+    reconciled = True
+    created, archived = 0, 0
+
+    for start in range(0, len(ticket_ids), ASSOCIATION_BATCH_SIZE):
+        batch = ticket_ids[start:start + ASSOCIATION_BATCH_SIZE]
+        batch_links = {ticket_id: expected_links[ticket_id] for ticket_id in batch}
+        try:
+            current = read_ticket_contact_associations(batch)
+            error_class = 'association_read_failed'
+        except Exception as e:
+            logging.error(f"Error reading ticket associations: {e}")
+            current, error_class = None, api.error_class(e)
+        if current is None:
+            dead_letter.record_failure('hubspot_associations', error_class, {"links": batch_links})
+            reconciled = False
+            continue
+
+        other_contact_ids = {linked for ticket_id, contact_id in batch_links.items()
+                             for linked in current.get(ticket_id, {}) if linked != contact_id}
+        recorded_contact_ids = store.known_hubspot_ids('contact', other_contact_ids) if store.enabled() else set()
+
+        to_create, to_archive = [], []
+        for ticket_id, contact_id in batch_links.items():
+            linked_contacts = current.get(ticket_id, {})
+            if not linked_contacts.get(contact_id):
+                to_create.append({"from": {"id": ticket_id}, "to": {"id": contact_id}, "types": [TICKET_CONTACT_ASSOCIATION_TYPE]})
+            stale_contact_ids = sorted(
+                linked for linked, labelled in linked_contacts.items()
+                if linked != contact_id and (labelled or linked in recorded_contact_ids)
+            )
+            if stale_contact_ids:
+                to_archive.append({"from": {"id": ticket_id}, "to": [{"id": stale_contact_id} for stale_contact_id in stale_contact_ids]})
+
+        for action, inputs in (("create", to_create), ("archive", to_archive)):
+            for input_start in range(0, len(inputs), ASSOCIATION_BATCH_SIZE):
+                try:
+                    written = write_ticket_contact_associations(action, inputs[input_start:input_start + ASSOCIATION_BATCH_SIZE])
+                    error_class = 'association_write_failed'
+                except Exception as e:
+                    logging.error(f"Error in association batch {action}: {e}")
+                    written, error_class = False, api.error_class(e)
+                if not written:
+                    dead_letter.record_failure('hubspot_associations', error_class, {"links": batch_links})
+                    reconciled = False
+        created += len(to_create)
+        archived += sum(len(archive_input['to']) for archive_input in to_archive)
+
+    logging.info(f"Reconciled associations for {len(ticket_ids)} tickets: {created} created, {archived} archived.")
+    return reconciled
+
+# Create or update the contact and tickets for a single enriched premise.
+# payloads is the (contact, ticket) payload pair from build_hubspot_payloads for the premise's
+# batch; it is built for this premise alone when omitted. Each written ticket is recorded in
+# expected_links (ticket ID -> contact ID) for the association reconciliation pass.
+# When contact_id is given the contact was already written for the premise's customer (see
+# process_customer_premises) and only the tickets are sent, attached to that contact.
+# Returns True if the contact and every ticket were written successfully.
+def process_premise(premise, sales_rep_data, ticket_types, payloads=None, expected_links=None, contact_id=None):
+    if not premise:
+        logging.warning("Premise data is None, skipping this premise.")
+        return False
+
+    logging.debug("Processing premise: %s", LazyJson(premise))
+
+    customer = premise.get('customer')
+    if customer is None:
+        logging.warning("Customer data is missing, skipping this premise.")
+        return False
+
+    # Retrieve service_id directly from the premise
+    service_id = premise.get('id')
+    if not service_id:
+        logging.warning("Service ID is missing, skipping this premise.")
+        return False
+
+    contact_payloads, ticket_payloads = payloads or build_hubspot_payloads([premise], sales_rep_data)
+
+    # Request failures (timeouts, or an open HubSpot breaker failing fast) park the premise
+    # rather than aborting the run
+    if contact_id is None:
+        try:
+            contact_id = create_or_update_contact_in_hubspot(premise, customer, sales_rep_data, contact_payloads.get(service_id))
+        except Exception as e:
+            logging.error(f"Error creating or updating contact for service {service_id}: {e}")
+            dead_letter.record_failure('hubspot_contact', api.error_class(e), {"premise": premise}, e)
+            return False
+    if not contact_id:
+        return False
+
+    services = premise.get('services', [])
+    if not isinstance(services, list):
+        logging.error(f"Expected 'services' to be a list, but got {type(services)}. Skipping premise.")
+        return False
+
+    logging.debug("Services for premise: %s", LazyJson(services))
+
+    succeeded = True
+    for service in services:
+        if not isinstance(service, dict):
+            logging.warning(f"Invalid service object: {service}. Skipping.")
+            continue
+
+        logging.debug("Processing service: %s", LazyJson(service))
+
+        service_details = service.get('service_details')
+        if not service_details or not isinstance(service_details, dict):
+            logging.warning("Service details are missing or invalid, skipping service.")
+            continue
+
+        full_service = service_details.get('full_service', {})
+        if not isinstance(full_service, dict):
+            logging.warning("Full service details are missing or invalid, skipping service.")
+            continue
+
+        logging.debug("Processing full_service: %s", LazyJson(full_service))
+
+        work_orders_data = service.get('work_orders')
+        if not work_orders_data or not isinstance(work_orders_data, dict):
+            logging.warning("Work orders data is missing or invalid, skipping service.")
+            continue
+
+        work_orders = work_orders_data.get('items', [])
+        if not isinstance(work_orders, list):
+            logging.warning(f"Expected 'work_orders' to be a list, but got {type(work_orders)}. Skipping service.")
+            continue
+
+        logging.debug("Work orders for service: %s", LazyJson(work_orders))
+
+        for work_order in work_orders:
+            if not isinstance(work_order, dict):
+                logging.warning(f"Invalid work order object: {work_order}. Skipping.")
+                continue
+
+            logging.debug("Processing work order: %s", LazyJson(work_order))
+
+            # Validate ticket creation inputs before proceeding
+            if not contact_id or not ticket_types:
+                logging.error("Required data for ticket creation is missing, skipping work order.")
+                continue
+
+            try:
+                ticket_id = create_or_update_tickets_for_contact(
+                    contact_id,
+                    work_order,
+                    ticket_types,
+                    premise,
+                    customer,
+                    {"id": service_id},
+                    sales_rep_data,
+                    ticket_payloads.get((service_id, work_order.get('id', '')))
+                )
+                succeeded = succeeded and bool(ticket_id)
+                if ticket_id and expected_links is not None:
+                    expected_links[str(ticket_id)] = str(contact_id)
+            except Exception as e:
+                logging.error(f"Error creating or updating tickets: {e}")
+                succeeded = False
+
+    return succeeded
+
+# Contact properties that describe one address; they are taken together from a single premise
+# so a merged contact never mixes the street of one premise with the zip of another
+CONTACT_ADDRESS_PROPERTIES = ("address", "city", "state", "zip", "latitude", "longitude")
+
+# Key premises of the same HubSpot contact: the customer's email (HubSpot's own de-duplication
+# key), else the AEX customer id. Premises with neither, or that process_premise would skip
+# (no customer data or service id), are never grouped.
+def customer_key(premise):
+    customer = premise.get('customer')
+    if not customer or not premise.get('id'):
+        return ('premise', id(premise))
+    email = (customer.get('email') or '').strip().lower()
+    if email:
+        return ('email', email)
+    if customer.get('id') or premise.get('customer_id'):
+        return ('customer', customer.get('id') or premise.get('customer_id'))
+    return ('premise', id(premise))
+
+# Group premises by customer, keeping the push order: groups are ordered by their first
+# (highest priority) premise, and premises keep their order within a group
+def group_premises_by_customer(premises):
+    groups = {}
+    for premise in premises:
+        if premise:
+            groups.setdefault(customer_key(premise), []).append(premise)
+    return list(groups.values())
+
+def _is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+# Merge the contact payloads of one customer's premises into a single payload.
+# Precedence: the premise with the most recent service updated_at (service_status_date) wins,
+# ties going to the earlier (higher priority) premise. Each property takes the winning
+# non-empty value; the address properties come as a unit from the most recent premise that
+# has an address. Returns (premise whose values won, merged payload).
+def merge_contact_payloads(premises, contact_payloads):
+    candidates = [
+        (premise, contact_payloads[premise.get('id')]['properties'])
+        for premise in premises if premise.get('id') in contact_payloads
+    ]
+    if not candidates:
+        return None, None
+
+    # Oldest first, so that later (more recent) values overwrite earlier ones
+    ordered = sorted(
+        enumerate(candidates),
+        key=lambda item: (item[1][1].get('service_status_date') or float('-inf'), -item[0])
+    )
+
+    merged = {}
+    for _, (premise, properties) in ordered:
+        has_address = not all(_is_empty(properties.get(name)) for name in CONTACT_ADDRESS_PROPERTIES)
+        for name, value in properties.items():
+            if name in CONTACT_ADDRESS_PROPERTIES:
+                if has_address:
+                    merged[name] = value
+            elif not _is_empty(value) or name not in merged:
+                merged[name] = value
+
+    return ordered[-1][1][0], {"properties": merged}
+
+# Write the contact for one customer once, from the merged payload of all their premises, then
+# send every premise's tickets attached to that single contact. related_premises are the
+# customer's other, unchanged premises (with their contact payloads in related_contact_payloads):
+# they take part in the merge so an older change cannot overwrite a newer one, but are not pushed.
+# Returns the service ids of the premises whose contact and tickets were all written.
+def process_customer_premises(premises, sales_rep_data, ticket_types, payloads, expected_links=None,
+                              related_premises=(), related_contact_payloads=None):
+    contact_payloads, _ = payloads
+    if len(premises) + len(related_premises) < 2:
+        return [premise['id'] for premise in premises
+                if process_premise(premise, sales_rep_data, ticket_types, payloads, expected_links)]
+
+    contact_premise, contact_data = merge_contact_payloads(
+        list(premises) + list(related_premises), {**(related_contact_payloads or {}), **contact_payloads}
+    )
+    logging.info(f"Writing one contact for {len(premises) + len(related_premises)} premises of customer {contact_premise.get('customer_id')}")
+    try:
+        contact_id = create_or_update_contact_in_hubspot(contact_premise, contact_premise['customer'], sales_rep_data, contact_data)
+        error_class, error = 'contact_write_failed', "Merged contact write failed"
+    except Exception as e:
+        logging.error(f"Error creating or updating contact for customer {contact_premise.get('customer_id')}: {e}")
+        contact_id, error_class, error = None, api.error_class(e), e
+
+    if not contact_id:
+        # The contact write already parked contact_premise unless it raised; park the others
+        for premise in premises:
+            if premise is not contact_premise or error_class != 'contact_write_failed':
+                dead_letter.record_failure('hubspot_contact', error_class, {"premise": premise}, error)
+        return []
+
+    if store.enabled():
+        for premise in premises:
+            store.save_hubspot_id('contact', premise.get('premise_id', ''), contact_id)
+
+    return [premise['id'] for premise in premises
+            if process_premise(premise, sales_rep_data, ticket_types, payloads, expected_links, contact_id)]
+
+# The stored premises of the batch's customers that are not in the batch, grouped by customer_key.
+# In store mode the push only loads changed premises, but the contact merge needs all of them.
+def _related_premises(batch):
+    if not store.enabled():
+        return {}
+    batch_ids = {premise.get('id') for premise in batch}
+    related = {}
+    for premise in store.load_premises_by_customer(premise.get('customer_id') for premise in batch):
+        if premise.get('id') not in batch_ids:
+            related.setdefault(customer_key(premise), []).append(premise)
+    return related
+
+# Split customer groups into transform batches of about TRANSFORM_BATCH_SIZE premises; a
+# customer's premises always share a batch
+def _customer_batches(groups):
+    batch = []
+    for group in groups:
+        if batch and len(batch) + len(group) > TRANSFORM_BATCH_SIZE:
+            yield batch
+            batch = []
+        batch.extend(group)
+    if batch:
+        yield batch
+
+# Process premises data and create or update contacts and tickets in HubSpot for multiple work orders.
+# Premises are grouped by customer so each customer gets exactly one contact write per run.
+# Without premises_data the enriched premises are loaded from the handoff (pending ones in store mode).
+def process_premises_for_hubspot(premises_data=None):
+    with profiling.stage('load_enriched'):
+        if premises_data is None:
+            premises_data = load_enriched_data()
+        sales_rep_data = load_sales_rep_data()
+        ticket_types = load_ticket_types()
+    expected_links = {}
+
+    # Push highest priority premises first (see priority.py)
+    from .priority import by_priority
+    premises_data = list(by_priority(premises_data))
+
+    groups = group_premises_by_customer(premises_data)
+
+    # Build the HubSpot payloads a batch at a time, then send them customer by customer
+    for batch in _customer_batches(groups):
+        with profiling.stage('transform'):
+            payloads = build_hubspot_payloads(batch, sales_rep_data)
+            related = _related_premises(batch)
+            related_contact_payloads, _ = build_hubspot_payloads([p for group in related.values() for p in group], sales_rep_data)
+
+        with profiling.stage('push'):
+            for group in group_premises_by_customer(batch):
+                pushed = process_customer_premises(group, sales_rep_data, ticket_types, payloads, expected_links,
+                                                   related.get(customer_key(group[0]), []), related_contact_payloads)
+                if len(pushed) < len(group):
+                    logging.warning(f"{len(group) - len(pushed)} of {len(group)} premises of a customer had failures; see the dead letters")
+
+                # Failed writes are parked as dead letters and retried through replay, so every
+                # processed premise is marked pushed; otherwise a permanent failure (such as an
+                # unknown work order status) would be re-sent and re-parked on every run
+                if store.enabled():
+                    for premise in group:
+                        if premise.get('id'):
+                            store.mark_premise_pushed(premise['id'])
+
+    if RECONCILE_ASSOCIATIONS:
+        with profiling.stage('reconcile'):
+            reconcile_ticket_associations(expected_links)
+
+# Push a single premise the way a full push would: its customer's other stored premises take
+# part in the merged contact, so replaying one premise cannot overwrite fresher contact data.
+# Returns True if the premise was pushed, and marks it pushed in the store.
+def push_premise(premise):
+    sales_rep_data = load_sales_rep_data()
+    payloads = build_hubspot_payloads([premise], sales_rep_data)
+    related = _related_premises([premise]).get(customer_key(premise), [])
+    related_contact_payloads, _ = build_hubspot_payloads(related, sales_rep_data)
+    if not process_customer_premises([premise], sales_rep_data, load_ticket_types(), payloads,
+                                     related_premises=related, related_contact_payloads=related_contact_payloads):
+        return False
+    if store.enabled():
+        store.mark_premise_pushed(premise['id'])
+    return True
+
+# Dead letter replay handler for a failed contact write: re-push the whole premise
+def replay_contact(payload):
+    return push_premise(payload['premise'])
+
+# Dead letter replay handler for a failed ticket write or unknown work order status
+def replay_ticket(payload):
+    premise = payload['premise']
+    ticket_id = create_or_update_tickets_for_contact(
+        payload['contact_id'],
+        payload['work_order'],
+        load_ticket_types(),
+        premise,
+        premise.get('customer') or {},
+        {"id": premise.get('id')},
+        load_sales_rep_data()
+    )
+    if ticket_id and RECONCILE_ASSOCIATIONS:
+        reconcile_ticket_associations({str(ticket_id): str(payload['contact_id'])})
+    return ticket_id
+
+# Dead letter replay handler for association writes that failed during reconciliation
+def replay_associations(payload):
+    return reconcile_ticket_associations(payload['links'])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Push enriched premises to HubSpot as contacts and tickets")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.profile:
+        profiling.enable(args.profile, prefix="hub")
+
+    require_hubspot_credentials()
+
+    process_premises_for_hubspot()
+    profiling.write_results()
+
+# Run the main function
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import json
+import heapq
+import logging
+from .hub import stage_for_status
+from .config import current_network
+
+# Weights for work order statuses; higher goes first. A weight applies to every status that
+# maps to the same pipeline stage, so "Cancellation pending" also covers "Cancelled" etc.
+# Override or extend with a JSON object of {status: weight} in PRIORITY_WEIGHTS_FILE.
+DEFAULT_PRIORITY_WEIGHTS = {
+    "Service Down": 100,
+    "Fiber Break": 100,
+    "Power Down": 90,
+    "Fault": 80,
+    "Cancellation pending": 70,
+    "Light Levels": 50,
+    "Auto Configuration Failed": 50,
+    "Deprovisioning": 40
+}
+
+# Weights for statuses without an explicit weight, by pipeline
+SERVICE_PIPELINE_DEFAULT_WEIGHT = int(os.getenv('SERVICE_PIPELINE_DEFAULT_WEIGHT', 20))
+INSTALLATION_PIPELINE_DEFAULT_WEIGHT = int(os.getenv('INSTALLATION_PIPELINE_DEFAULT_WEIGHT', 10))
+
+# Load the configured status weights, keyed by (pipeline, stage id) via the current network's stage maps
+def load_stage_weights(filename=None):
+    weights = dict(DEFAULT_PRIORITY_WEIGHTS)
+    filename = filename or os.getenv('PRIORITY_WEIGHTS_FILE')
+    if filename:
+        try:
+            with open(filename, 'r') as json_file:
+                weights.update(json.load(json_file))
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            logging.error(f"Could not load priority weights from '{filename}': {e}")
+
+    stage_weights = {}
+    for status, weight in weights.items():
+        stage = stage_for_status(status)
+        if stage is None:
+            logging.warning(f"Priority weight for unknown work order status '{status}' ignored.")
+            continue
+        stage_weights[stage] = weight
+    return stage_weights
+
+_network_weights = {}
+
+# Stage weights of the current network, built once per network
+def _stage_weights():
+    network = current_network()
+    if network.name not in _network_weights:
+        _network_weights[network.name] = load_stage_weights()
+    return _network_weights[network.name]
+
+# Priority weight of a single work order status
+def status_priority(status):
+    stage_weights = _stage_weights()
+    stage = stage_for_status(status)
+    if stage is None:
+        return 0
+    if stage in stage_weights:
+        return stage_weights[stage]
+    return SERVICE_PIPELINE_DEFAULT_WEIGHT if stage[0] == "service" else INSTALLATION_PIPELINE_DEFAULT_WEIGHT
+
+# Highest priority across the service status and the work orders of a premise. Work orders
+# come from the enriched services, or from work_orders_by_service before enrichment.
+def premise_priority(premise, work_orders_by_service=None):
+    statuses = [premise.get('status')]
+    if work_orders_by_service is not None:
+        work_order_groups = [work_orders_by_service.get(premise.get('id'), {})]
+    else:
+        work_order_groups = [service.get('work_orders') for service in premise.get('services') or [] if isinstance(service, dict)]
+    for work_orders in work_order_groups:
+        if isinstance(work_orders, dict):
+            statuses.extend(work_order.get('status') for work_order in work_orders.get('items', []) if isinstance(work_order, dict))
+    return max(status_priority(status) for status in statuses)
+
+# Whether a premise outranks routine installation work, i.e. weighs more than the installation
+# pipeline default; run enriches and pushes these before the rest
+def is_urgent(premise, work_orders_by_service=None):
+    return premise_priority(premise, work_orders_by_service) > INSTALLATION_PIPELINE_DEFAULT_WEIGHT
+
+# Yield premises highest priority first from a heap; equal priorities keep their input order
+def by_priority(premises, work_orders_by_service=None):
+    queue = [(-premise_priority(premise, work_orders_by_service), position, premise)
+             for position, premise in enumerate(premises) if premise]
+    heapq.heapify(queue)
+    while queue:
+        yield heapq.heappop(queue)[2]
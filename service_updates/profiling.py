@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import json
+import cProfile
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from .config import current_network, DEFAULT_NETWORK
+
+# Default output directory for --profile
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+# Interval (seconds) between stack samples taken for the collapsed-stack output
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))
+
+_settings = {"enabled": False, "output_dir": PROFILE_DIR, "prefix": "run"}
+_stages = {}
+
+# Turn profiling on for this process; stage() is a no-op until this is called
+def enable(output_dir=None, prefix="run"):
+    _settings.update(enabled=True, output_dir=output_dir or PROFILE_DIR, prefix=prefix)
+    os.makedirs(_settings["output_dir"], exist_ok=True)
+
+def is_enabled():
+    return _settings["enabled"]
+
+# Add the standard --profile option to a script's argument parser
+def add_profile_argument(parser):
+    parser.add_argument(
+        "--profile", nargs="?", const=PROFILE_DIR, default=None, metavar="DIR",
+        help=f"Write per-stage pstats, collapsed stacks and a wall/CPU summary to DIR (default: {PROFILE_DIR})"
+    )
+
+class _StageProfile:
+    """Accumulated cProfile data, wall/CPU time and stack samples for one named stage."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.samples = Counter()
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.calls = 0
+
+# Sample the stack of the profiled thread until stop is set. Samples are wall-clock based,
+# so time spent blocked in network calls shows up in the flamegraph as well.
+def _sample(thread_id, samples, stop):
+    while not stop.wait(PROFILE_SAMPLE_INTERVAL):
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if stack:
+            samples[";".join(reversed(stack))] += 1
+
+# Profile a pipeline stage. Re-entering a stage name accumulates into the same profile, so
+# per-batch stages are reported once. Stages must not be nested. When several networks are
+# synced at once, each network's stages are reported separately as <network>.<stage>.
+@contextmanager
+def stage(name):
+    if not _settings["enabled"]:
+        yield
+        return
+
+    network = current_network()
+    if network is not DEFAULT_NETWORK:
+        name = f"{network.name}.{name}"
+    stage_profile = _stages.setdefault(name, _StageProfile())
+    stop = threading.Event()
+    sampler = threading.Thread(target=_sample, args=(threading.get_ident(), stage_profile.samples, stop), daemon=True)
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    sampler.start()
+    # Only one cProfile can be active at a time on some Python versions; concurrent stages
+    # from other networks still get wall/CPU times and stack samples
+    try:
+        stage_profile.profile.enable()
+        profiled = True
+    except ValueError:
+        profiled = False
+    try:
+        yield
+    finally:
+        if profiled:
+            stage_profile.profile.disable()
+        stop.set()
+        sampler.join()
+        stage_profile.wall += time.perf_counter() - wall_start
+        stage_profile.cpu += time.process_time() - cpu_start
+        stage_profile.calls += 1
+
+# Write <prefix>-<stage>.pstats and <prefix>-<stage>.collapsed for every stage plus a
+# <prefix>-summary.json wall-clock vs CPU breakdown, and log the breakdown
+def write_results():
+    if not _settings["enabled"] or not _stages:
+        return
+
+    output_dir, prefix = _settings["output_dir"], _settings["prefix"]
+    summary = {}
+    for name, stage_profile in _stages.items():
+        base = os.path.join(output_dir, f"{prefix}-{name}")
+        stage_profile.profile.dump_stats(f"{base}.pstats")
+        with open(f"{base}.collapsed", 'w') as collapsed_file:
+            for stack, count in stage_profile.samples.most_common():
+                collapsed_file.write(f"{stack} {count}\n")
+
+        summary[name] = {
+            "calls": stage_profile.calls,
+            "wall_seconds": round(stage_profile.wall, 3),
+            "cpu_seconds": round(stage_profile.cpu, 3),
+            "wait_seconds": round(max(stage_profile.wall - stage_profile.cpu, 0.0), 3)
+        }
+        logging.info(f"Profile {prefix}/{name}: wall {stage_profile.wall:.2f}s, cpu {stage_profile.cpu:.2f}s, "
+                     f"waiting {max(stage_profile.wall - stage_profile.cpu, 0.0):.2f}s over {stage_profile.calls} call(s)")
+
+    with open(os.path.join(output_dir, f"{prefix}-summary.json"), 'w') as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    logging.info(f"Profiles written to {output_dir}")
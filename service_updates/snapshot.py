@@ -0,0 +1,186 @@
+import os
+import time
+import uuid
+import gzip
+import lzma
+import json
+import mmap
+import argparse
+import logging
+from . import store
+
+# Snapshot layout: <name>.snap holds independently compressed chunks of up to CHUNK_SIZE
+# records (each a JSON array), and <name>.snap.idx is a JSON sidecar with the byte offset of
+# every chunk plus premise_id / service_id -> (chunk, position) lookups. A single record is
+# read by mapping the data file and decompressing only the chunk that holds it.
+# Both files carry the same generation id (the first GENERATION_SIZE bytes of the data file),
+# so a reader can tell when it opened the index of one write and the data file of another.
+SNAPSHOT_CHUNK_SIZE = int(os.getenv('SNAPSHOT_CHUNK_SIZE', 256))
+SNAPSHOT_COMPRESSION = os.getenv('SNAPSHOT_COMPRESSION', 'gzip')
+
+# Snapshot files used when HANDOFF_FORMAT=snapshot
+CUSTOMERS_SNAPSHOT = os.getenv('CUSTOMERS_SNAPSHOT_FILE', 'customers.snap')
+ENRICHED_SNAPSHOT = os.getenv('ENRICHED_SNAPSHOT_FILE', 'enriched_premises_data.snap')
+
+GENERATION_SIZE = 32
+
+CODECS = {
+    "gzip": (gzip.compress, gzip.decompress),
+    "lzma": (lzma.compress, lzma.decompress)
+}
+
+# True when the stages should hand off through snapshot files
+def enabled():
+    return store.HANDOFF_FORMAT == 'snapshot'
+
+def index_path(path):
+    return f"{path}.idx"
+
+# Write records as a compressed, chunked snapshot with its offset index
+def write_snapshot(records, path, chunk_size=SNAPSHOT_CHUNK_SIZE, compression=SNAPSHOT_COMPRESSION):
+    compress, _ = CODECS[compression]
+    generation = uuid.uuid4().hex
+    index = {"version": 2, "generation": generation, "compression": compression, "count": 0, "chunks": [],
+             "premise_id": {}, "service_id": {}}
+    offset = GENERATION_SIZE
+
+    with open(f"{path}.tmp", 'wb') as data_file:
+        data_file.write(generation.encode('ascii'))
+        for chunk_number, start in enumerate(range(0, len(records), chunk_size)):
+            chunk = records[start:start + chunk_size]
+            payload = compress(json.dumps(chunk, separators=(',', ':')).encode('utf-8'))
+            data_file.write(payload)
+            index["chunks"].append([offset, len(payload), len(chunk)])
+            offset += len(payload)
+
+            for position, record in enumerate(chunk):
+                location = [chunk_number, position]
+                if record.get('premise_id') is not None:
+                    index["premise_id"].setdefault(str(record['premise_id']), []).append(location)
+                if record.get('id') is not None:
+                    index["service_id"][str(record['id'])] = location
+        index["count"] = len(records)
+
+    with open(f"{index_path(path)}.tmp", 'w') as index_file:
+        json.dump(index, index_file, separators=(',', ':'))
+
+    # Swap both files in only once they are complete, the index first: until the data file
+    # follows, readers see mismatched generations and retry rather than use wrong offsets
+    os.replace(f"{index_path(path)}.tmp", index_path(path))
+    os.replace(f"{path}.tmp", path)
+    logging.info(f"Snapshot of {len(records)} records saved to {path} ({offset} bytes, {len(index['chunks'])} chunks)")
+
+def load_index(path):
+    with open(index_path(path), 'r') as index_file:
+        return json.load(index_file)
+
+# Generation id at the head of an open data file (None for version 1 snapshots, which have none)
+def read_generation(data_file, index):
+    if index.get("version", 1) < 2:
+        return None
+    data_file.seek(0)
+    return data_file.read(GENERATION_SIZE).decode('ascii', errors='replace')
+
+class SnapshotReader:
+    """Random access to a snapshot through mmap; decompresses one chunk at a time."""
+
+    # Attempts to open a matching index and data file while a write is swapping them in
+    OPEN_ATTEMPTS = 5
+
+    def __init__(self, path):
+        self.path = path
+        for attempt in range(self.OPEN_ATTEMPTS):
+            self.index = load_index(path)
+            self._file = open(path, 'rb')
+            if read_generation(self._file, self.index) == self.index.get("generation"):
+                break
+            self._file.close()
+            time.sleep(0.05 * (attempt + 1))
+        else:
+            raise ValueError(f"Snapshot '{path}' and its index are from different writes")
+        _, self._decompress = CODECS[self.index["compression"]]
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.index["chunks"] else None
+        self._cached_chunk = (None, None)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.index["count"]
+
+    def chunk(self, chunk_number):
+        if self._cached_chunk[0] != chunk_number:
+            offset, length, _ = self.index["chunks"][chunk_number]
+            records = json.loads(self._decompress(self._map[offset:offset + length]))
+            self._cached_chunk = (chunk_number, records)
+        return self._cached_chunk[1]
+
+    def by_service_id(self, service_id):
+        location = self.index["service_id"].get(str(service_id))
+        if location is None:
+            return None
+        chunk_number, position = location
+        return self.chunk(chunk_number)[position]
+
+    def by_premise_id(self, premise_id):
+        return [self.chunk(chunk_number)[position]
+                for chunk_number, position in self.index["premise_id"].get(str(premise_id), [])]
+
+    # Records start..stop (exclusive) in file order, decoding only the chunks that overlap
+    def range(self, start, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        records, first = [], 0
+        for chunk_number, (_, _, count) in enumerate(self.index["chunks"]):
+            last = first + count
+            if last > start and first < stop:
+                chunk = self.chunk(chunk_number)
+                records.extend(chunk[max(start - first, 0):stop - first])
+            if last >= stop:
+                break
+            first = last
+        return records
+
+    def __iter__(self):
+        for chunk_number in range(len(self.index["chunks"])):
+            yield from self.chunk(chunk_number)
+
+# Load every record of a snapshot
+def read_snapshot(path):
+    with SnapshotReader(path) as reader:
+        return list(reader)
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Read records from a service updates snapshot")
+    parser.add_argument("path", help="Snapshot data file, e.g. enriched_premises_data.snap")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("info", help="Show record, chunk and size counts")
+    get_parser = subparsers.add_parser("get", help="Read records by premise or service id")
+    group = get_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--premise-id")
+    group.add_argument("--service-id")
+    range_parser = subparsers.add_parser("range", help="Read records by position")
+    range_parser.add_argument("start", type=int)
+    range_parser.add_argument("stop", type=int, nargs="?")
+
+    args = parser.parse_args()
+    with SnapshotReader(args.path) as reader:
+        if args.command == "info":
+            print(f"{len(reader)} records in {len(reader.index['chunks'])} {reader.index['compression']} chunks, "
+                  f"{os.path.getsize(args.path)} bytes")
+        elif args.command == "get":
+            records = reader.by_premise_id(args.premise_id) if args.premise_id else [reader.by_service_id(args.service_id)]
+            print(json.dumps([record for record in records if record is not None], indent=2))
+        else:
+            print(json.dumps(reader.range(args.start, args.stop), indent=2))
+
+if __name__ == "__main__":
+    main()
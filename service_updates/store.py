@@ -0,0 +1,353 @@
+import os
+import json
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime
+from .config import state_path
+
+# Where the pipeline stages hand data to each other: "sqlite" uses the indexed state store
+# below, "json" keeps the legacy customers.json / enriched_premises_data.json files
+HANDOFF_FORMAT = os.getenv('HANDOFF_FORMAT', 'sqlite')
+
+# Path of the SQLite state store
+STATE_DB = os.getenv('STATE_DB', 'service_updates.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS services (
+    service_id INTEGER PRIMARY KEY,
+    premise_id INTEGER,
+    customer_id INTEGER,
+    updated_at TEXT,
+    data TEXT NOT NULL,
+    changed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_services_premise_id ON services (premise_id);
+CREATE INDEX IF NOT EXISTS idx_services_customer_id ON services (customer_id);
+
+CREATE TABLE IF NOT EXISTS premises (
+    service_id INTEGER PRIMARY KEY,
+    premise_id INTEGER,
+    customer_id INTEGER,
+    data TEXT NOT NULL,
+    changed_at TEXT NOT NULL,
+    enriched_at TEXT NOT NULL,
+    pushed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_premises_premise_id ON premises (premise_id);
+CREATE INDEX IF NOT EXISTS idx_premises_customer_id ON premises (customer_id);
+
+CREATE TABLE IF NOT EXISTS work_orders (
+    work_order_id INTEGER PRIMARY KEY,
+    service_id INTEGER,
+    status TEXT,
+    data TEXT NOT NULL,
+    changed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_work_orders_service_id ON work_orders (service_id);
+
+CREATE TABLE IF NOT EXISTS customers (
+    customer_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    changed_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS hubspot_ids (
+    object_type TEXT NOT NULL,
+    aex_id TEXT NOT NULL,
+    hubspot_id TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (object_type, aex_id)
+);
+CREATE INDEX IF NOT EXISTS idx_hubspot_ids_hubspot_id ON hubspot_ids (hubspot_id);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    updated_at TEXT NOT NULL
+);
+"""
+
+_connections = threading.local()
+
+# True when the stages should hand off through the state store
+def enabled():
+    return HANDOFF_FORMAT == 'sqlite'
+
+# Open (once per thread and network) the state store in WAL mode so one stage can write while another reads
+def get_connection(filename=None):
+    path = state_path(filename or STATE_DB)
+    cache = getattr(_connections, 'by_path', None)
+    if cache is None:
+        cache = _connections.by_path = {}
+    if path not in cache:
+        connection = sqlite3.connect(path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        cache[path] = connection
+    return cache[path]
+
+def _now():
+    return datetime.now().isoformat()
+
+def _dumps(record):
+    return json.dumps(record, sort_keys=True)
+
+# Upsert services from the fetch stage. changed_at only moves when the stored record differs,
+# so enrichment can pick up just the rows that changed.
+def upsert_services(services):
+    conn = get_connection()
+    now = _now()
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO services (service_id, premise_id, customer_id, updated_at, data, changed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (service_id) DO UPDATE SET
+                premise_id = excluded.premise_id,
+                customer_id = excluded.customer_id,
+                updated_at = excluded.updated_at,
+                data = excluded.data,
+                changed_at = excluded.changed_at
+            WHERE services.data != excluded.data
+            """,
+            [
+                (service['id'], service.get('premise_id'), service.get('customer_id'),
+                 service.get('updated_at'), _dumps(service), now)
+                for service in services
+            ]
+        )
+    logging.info(f"Upserted {len(services)} services into {state_path(STATE_DB)}")
+
+# Services whose work orders in work_orders_by_service ({service_id: {"items": [...]}}, the
+# bulk /work-orders window) are new or differ from the stored work_orders rows
+def services_with_changed_work_orders(work_orders_by_service):
+    conn = get_connection()
+    changed = set()
+    for service_id, work_orders in work_orders_by_service.items():
+        stored = {
+            row['work_order_id']: row['data']
+            for row in conn.execute("SELECT work_order_id, data FROM work_orders WHERE service_id = ?", (service_id,))
+        }
+        for work_order in work_orders.get('items', []):
+            if isinstance(work_order, dict) and stored.get(work_order.get('id')) != _dumps(work_order):
+                changed.add(service_id)
+                break
+    return changed
+
+# Services that changed since their premise was last enriched (or were never enriched), plus
+# services whose work orders changed in the given bulk window even though the service did not
+def load_pending_services(work_orders_by_service=None):
+    conn = get_connection()
+    rows = conn.execute(
+        """
+        SELECT s.service_id, s.data FROM services s
+        LEFT JOIN premises p ON p.service_id = s.service_id
+        WHERE p.service_id IS NULL OR p.enriched_at < s.changed_at
+        """
+    ).fetchall()
+    pending = {row['service_id']: row['data'] for row in rows}
+
+    if work_orders_by_service:
+        changed = sorted(services_with_changed_work_orders(work_orders_by_service) - set(pending))
+        for start in range(0, len(changed), 500):
+            batch = changed[start:start + 500]
+            rows = conn.execute(
+                f"SELECT service_id, data FROM services WHERE service_id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            pending.update((row['service_id'], row['data']) for row in rows)
+        if changed:
+            logging.info(f"{len(changed)} unchanged services have work order changes and will be re-enriched")
+
+    return [json.loads(pending[service_id]) for service_id in sorted(pending)]
+
+# Upsert enriched premises together with their work orders and customers
+def upsert_enriched_premises(premises):
+    conn = get_connection()
+    now = _now()
+    premise_rows, work_order_rows, customer_rows = [], [], []
+
+    for premise in premises:
+        premise_rows.append((premise['id'], premise.get('premise_id'), premise.get('customer_id'),
+                             _dumps(premise), now, now))
+
+        customer = premise.get('customer') or {}
+        if customer.get('id') is not None:
+            customer_rows.append((customer['id'], _dumps(customer), now))
+
+        for service in premise.get('services', []):
+            work_orders = service.get('work_orders')
+            if not isinstance(work_orders, dict):
+                continue
+            for work_order in work_orders.get('items', []):
+                if isinstance(work_order, dict) and work_order.get('id') is not None:
+                    work_order_rows.append((work_order['id'], premise['id'], work_order.get('status'),
+                                            _dumps(work_order), now))
+
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO premises (service_id, premise_id, customer_id, data, changed_at, enriched_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (service_id) DO UPDATE SET
+                premise_id = excluded.premise_id,
+                customer_id = excluded.customer_id,
+                data = excluded.data,
+                changed_at = CASE WHEN premises.data != excluded.data THEN excluded.changed_at ELSE premises.changed_at END,
+                enriched_at = excluded.enriched_at
+            """,
+            premise_rows
+        )
+        conn.executemany(
+            """
+            INSERT INTO work_orders (work_order_id, service_id, status, data, changed_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (work_order_id) DO UPDATE SET
+                service_id = excluded.service_id,
+                status = excluded.status,
+                data = excluded.data,
+                changed_at = excluded.changed_at
+            WHERE work_orders.data != excluded.data
+            """,
+            work_order_rows
+        )
+        conn.executemany(
+            """
+            INSERT INTO customers (customer_id, data, changed_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT (customer_id) DO UPDATE SET
+                data = excluded.data,
+                changed_at = excluded.changed_at
+            WHERE customers.data != excluded.data
+            """,
+            customer_rows
+        )
+    logging.info(f"Upserted {len(premise_rows)} enriched premises, {len(work_order_rows)} work orders "
+                 f"and {len(customer_rows)} customers into {state_path(STATE_DB)}")
+
+# Enriched premises that changed since they were last pushed to HubSpot
+def load_pending_premises():
+    rows = get_connection().execute(
+        "SELECT data FROM premises WHERE pushed_at IS NULL OR pushed_at < changed_at ORDER BY service_id"
+    ).fetchall()
+    return [json.loads(row['data']) for row in rows]
+
+# All enriched premises of the given customers, whether or not they are pending
+def load_premises_by_customer(customer_ids):
+    conn = get_connection()
+    customer_ids = sorted({customer_id for customer_id in customer_ids if customer_id is not None})
+    premises = []
+    for start in range(0, len(customer_ids), 500):
+        batch = customer_ids[start:start + 500]
+        rows = conn.execute(
+            f"SELECT data FROM premises WHERE customer_id IN ({','.join('?' * len(batch))}) ORDER BY service_id", batch
+        ).fetchall()
+        premises.extend(json.loads(row['data']) for row in rows)
+    return premises
+
+# Record that a premise was pushed to HubSpot successfully
+def mark_premise_pushed(service_id):
+    conn = get_connection()
+    with conn:
+        conn.execute("UPDATE premises SET pushed_at = ? WHERE service_id = ?", (_now(), service_id))
+
+# Remember the HubSpot id for an AEX object (e.g. "contact" by premise_id, "ticket" by work_order_id)
+def save_hubspot_id(object_type, aex_id, hubspot_id):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO hubspot_ids (object_type, aex_id, hubspot_id, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (object_type, aex_id) DO UPDATE SET
+                hubspot_id = excluded.hubspot_id,
+                updated_at = excluded.updated_at
+            """,
+            (object_type, str(aex_id), str(hubspot_id), _now())
+        )
+
+# The subset of the given HubSpot ids that the integration recorded for an object type
+def known_hubspot_ids(object_type, hubspot_ids):
+    conn = get_connection()
+    hubspot_ids = sorted({str(hubspot_id) for hubspot_id in hubspot_ids})
+    known = set()
+    for start in range(0, len(hubspot_ids), 500):
+        batch = hubspot_ids[start:start + 500]
+        rows = conn.execute(
+            f"SELECT hubspot_id FROM hubspot_ids WHERE object_type = ? AND hubspot_id IN ({','.join('?' * len(batch))})",
+            [object_type] + batch
+        ).fetchall()
+        known.update(row['hubspot_id'] for row in rows)
+    return known
+
+def get_hubspot_id(object_type, aex_id):
+    row = get_connection().execute(
+        "SELECT hubspot_id FROM hubspot_ids WHERE object_type = ? AND aex_id = ?", (object_type, str(aex_id))
+    ).fetchone()
+    return row['hubspot_id'] if row else None
+
+def get_sync_state(key, default=None):
+    row = get_connection().execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return json.loads(row['value']) if row else default
+
+def set_sync_state(key, value):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO sync_state (key, value, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+            """,
+            (key, json.dumps(value), _now())
+        )
+
+# Everything the store knows about one premise: its services, enrichment/push timestamps,
+# work orders and the HubSpot ids they map to
+def premise_history(premise_id):
+    conn = get_connection()
+    history = {"premise_id": premise_id, "services": []}
+    contact_id = get_hubspot_id('contact', premise_id)
+    if contact_id:
+        history["hubspot_contact_id"] = contact_id
+
+    for service in conn.execute("SELECT * FROM services WHERE premise_id = ?", (premise_id,)).fetchall():
+        premise = conn.execute(
+            "SELECT changed_at, enriched_at, pushed_at FROM premises WHERE service_id = ?", (service['service_id'],)
+        ).fetchone()
+        work_orders = conn.execute(
+            "SELECT work_order_id, status, changed_at FROM work_orders WHERE service_id = ? ORDER BY work_order_id",
+            (service['service_id'],)
+        ).fetchall()
+        history["services"].append({
+            "service_id": service['service_id'],
+            "customer_id": service['customer_id'],
+            "status": json.loads(service['data']).get('status'),
+            "updated_at": service['updated_at'],
+            "changed_at": service['changed_at'],
+            "enriched_at": premise['enriched_at'] if premise else None,
+            "pushed_at": premise['pushed_at'] if premise else None,
+            "work_orders": [
+                dict(work_order, hubspot_ticket_id=get_hubspot_id('ticket', work_order['work_order_id']))
+                for work_order in work_orders
+            ]
+        })
+    return history
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the service updates state store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    premise_parser = subparsers.add_parser("premise", help="Show what happened to a premise")
+    premise_parser.add_argument("premise_id", type=int)
+    subparsers.add_parser("pending", help="Count rows waiting for enrichment or push")
+
+    args = parser.parse_args()
+    if args.command == "premise":
+        print(json.dumps(premise_history(args.premise_id), indent=2))
+    else:
+        print(f"Services pending enrichment: {len(load_pending_services())}")
+        print(f"Premises pending push: {len(load_pending_premises())}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from service_updates import api
+from service_updates.api import CircuitBreaker, CircuitOpenError, RateLimiter
+
+COOLDOWN = 0.05
+
+
+def make_breaker():
+    return CircuitBreaker("test", window=4, min_calls=2, error_rate=0.5, cooldown=COOLDOWN)
+
+
+def open_breaker(breaker):
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record(False)
+    assert breaker.state == 'open'
+
+
+def test_breaker_stays_closed_below_min_calls():
+    breaker = make_breaker()
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+
+def test_breaker_opens_then_half_opens_and_closes_after_successful_probe():
+    breaker = make_breaker()
+    open_breaker(breaker)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(COOLDOWN * 1.5)
+    breaker.before_call()  # the probe
+    assert breaker.state == 'half_open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one probe at a time
+
+    breaker.record(True)
+    assert breaker.state == 'closed'
+    assert not breaker.is_open()
+    breaker.before_call()
+
+    # The failures from before the outage no longer count
+    breaker.record(False)
+    assert breaker.state == 'closed'
+
+
+def test_failed_probe_reopens_breaker_for_another_cooldown():
+    breaker = make_breaker()
+    open_breaker(breaker)
+    time.sleep(COOLDOWN * 1.5)
+    breaker.before_call()
+    breaker.record(False)
+
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    time.sleep(COOLDOWN * 1.5)
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+
+
+class FailingSession:
+    def __init__(self):
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append(kwargs['timeout'])
+        raise requests.exceptions.ReadTimeout("timed out")
+
+
+def test_send_counts_timeouts_and_fails_fast_once_open():
+    breaker = make_breaker()
+    session = FailingSession()
+    timeouts = {"default": 7}
+
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            api._send(session, "GET", "https://example.test/services/1", {}, breaker, timeouts, "services/{id}")
+    with pytest.raises(CircuitOpenError) as error:
+        api._send(session, "GET", "https://example.test/services/1", {}, breaker, timeouts, "services/{id}")
+
+    assert len(session.calls) == 2
+    assert session.calls[0] == (api.CONNECT_TIMEOUT_SECONDS, 7)
+    assert api.error_class(error.value) == 'circuit_open'
+
+
+def test_unlimited_rate_limiter_does_not_block():
+    limiter = RateLimiter(None)
+    start = time.monotonic()
+    for _ in range(1000):
+        limiter.acquire('a')
+    assert time.monotonic() - start < 1
+
+
+def test_rate_limiter_grants_fairly_across_keys():
+    limiter = RateLimiter(50)
+    limiter.tokens = 0  # no initial burst, so both keys wait from the start
+    grants = []
+    barrier = threading.Barrier(2)
+
+    def worker(key, count):
+        barrier.wait()
+        for _ in range(count):
+            limiter.acquire(key)
+            grants.append(key)
+
+    threads = [threading.Thread(target=worker, args=('busy', 40)), threading.Thread(target=worker, args=('quiet', 10))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert limiter.granted == {'busy': 40, 'quiet': 10}
+    # While both wait, grants alternate, so the quiet key is done within its fair share
+    # instead of queueing behind the busy one
+    last_quiet = max(position for position, key in enumerate(grants) if key == 'quiet')
+    assert last_quiet < 24
@@ -0,0 +1,208 @@
+import math
+
+import pandas as pd
+
+from service_updates import hub
+
+SALES_REPS = pd.DataFrame({
+    "sales_channel_id": [5, 5, 6],
+    "Sales_Channel_Text": ["Alice", "Alice (duplicate)", "Bob"]
+})
+
+
+def make_premise(service_id, sales_channel_id=5, updated_at="2024-03-01T10:00:00+00:00", work_orders=(),
+                 city="Cape Town", product="Fibre 100"):
+    return {
+        "id": service_id,
+        "premise_id": service_id * 10,
+        "customer_id": 7,
+        "status": "Pre Order",
+        "sales_channel_id": sales_channel_id,
+        "customer": {"id": 7, "first_name": "Ann", "last_name": "Lee", "email": "ann@example.test",
+                     "mobile_number": "0821234567"},
+        "services": [{
+            "service_details": {"full_service": {
+                "premise": {"street_number": "12", "street_name": "Main Rd", "city": city,
+                            "province": "WC", "postal_code": "8001", "lat": -33.9, "lon": 18.4},
+                "service": {"updated_at": updated_at},
+                "isp_product": {"name": product}
+            }},
+            "work_orders": {"items": list(work_orders)}
+        }]
+    }
+
+
+# The per-premise payloads as the send functions built them before the columnar transform
+def _sales_rep(sales_rep_id, default):
+    if pd.isna(sales_rep_id):
+        return default
+    matching_rows = SALES_REPS.loc[SALES_REPS['sales_channel_id'] == sales_rep_id, 'Sales_Channel_Text']
+    return matching_rows.iloc[0] if not matching_rows.empty else default
+
+
+def per_record_contact(premise):
+    full_service = premise['services'][0]['service_details']['full_service']
+    full_service_premise = full_service['premise']
+    return {"properties": {
+        "firstname": premise['customer'].get('first_name', ''),
+        "lastname": premise['customer'].get('last_name', ''),
+        "email": premise['customer'].get('email', ''),
+        "phone": premise['customer'].get('mobile_number', ''),
+        "address": f"{full_service_premise.get('street_number', '')} {full_service_premise.get('street_name', '')}",
+        "city": full_service_premise.get('city', ''),
+        "state": full_service_premise.get('province', ''),
+        "zip": full_service_premise.get('postal_code', ''),
+        "aex_id": premise.get('premise_id', ''),
+        "latitude": full_service_premise.get('lat', ''),
+        "longitude": full_service_premise.get('lon', ''),
+        "service_status_date": hub.format_date_to_unix(full_service['service'].get('updated_at')),
+        "sales_rep": _sales_rep(premise.get('sales_channel_id'), 'No Sales Agent Selected'),
+        "sales_rep_id": premise.get('sales_channel_id'),
+        "service_status": premise.get('status', '')
+    }}
+
+
+def per_record_ticket_update(premise, work_order):
+    full_service = premise['services'][0]['service_details']['full_service']
+    street_address = f"{full_service['premise'].get('street_number', '')} {full_service['premise'].get('street_name', '')}"
+    _, stage_id = hub.stage_for_status(work_order['status'])
+    return {
+        "subject": f"{street_address} - {work_order['status'].strip()}",
+        "content": work_order.get('description', ''),
+        "hs_pipeline_stage": stage_id,
+        "work_order_id1": work_order['id'],
+        "hubspot_owner_id": None,
+        "premise_id": premise.get('premise_id', ''),
+        "customer_id": premise['customer'].get('id', ''),
+        "createdate": hub.format_date_to_timestamp(work_order.get('created_at', '')),
+        "aex_create_date": hub.format_date_to_timestamp(work_order.get('created_at', '')),
+        "sales_rep": _sales_rep(premise.get('sales_channel_id'), ''),
+        "sales_rep_id": premise.get('sales_channel_id'),
+        "service_status": premise.get('status', ''),
+        "schedule_date": hub.format_date_to_timestamp(work_order.get('schedule_date', '')),
+        "closed_date": hub.format_date_to_timestamp(work_order.get('completed_date', '')),
+        "service_id": premise['id'],
+        "product": full_service['isp_product']['name']
+    }
+
+
+def assert_no_nan(value):
+    if isinstance(value, dict):
+        for item in value.values():
+            assert_no_nan(item)
+    else:
+        assert not (isinstance(value, float) and math.isnan(value))
+        assert value is not pd.NaT
+
+
+WORK_ORDER = {"id": 901, "status": " Fiber Ready ", "description": "Install",
+              "created_at": "2024-02-01T08:00:00+00:00", "schedule_date": "2024-02-03T08:00:00+00:00"}
+
+
+def test_contact_payloads_match_per_record_build():
+    premises = [
+        make_premise(1),                        # known sales rep (first row wins)
+        make_premise(2, sales_channel_id=6),
+        make_premise(3, sales_channel_id=99),   # unknown sales rep
+        make_premise(4, sales_channel_id=None),
+        make_premise(5, updated_at=None),       # no status date
+    ]
+    contact_payloads, _ = hub.build_hubspot_payloads(premises, SALES_REPS)
+
+    for premise in premises:
+        assert contact_payloads[premise['id']] == per_record_contact(premise)
+    assert contact_payloads[1]['properties']['sales_rep'] == "Alice"
+    assert contact_payloads[3]['properties']['sales_rep'] == "No Sales Agent Selected"
+    assert contact_payloads[4]['properties']['sales_rep'] == "No Sales Agent Selected"
+    assert contact_payloads[5]['properties']['service_status_date'] is None
+
+
+def test_ticket_payloads_match_per_record_build_and_default_dates():
+    premises = [
+        make_premise(1, work_orders=[WORK_ORDER]),
+        make_premise(2, sales_channel_id=99, work_orders=[{"id": 902, "status": "pre order"}]),
+    ]
+    _, ticket_payloads = hub.build_hubspot_payloads(premises, SALES_REPS)
+
+    assert ticket_payloads[(1, 901)]['update'] == per_record_ticket_update(premises[0], WORK_ORDER)
+    assert ticket_payloads[(1, 901)]['create']['sales_rep'] == "Alice"
+    assert ticket_payloads[(1, 901)]['create']['closed_date'] is None
+
+    missing = ticket_payloads[(2, 902)]
+    assert missing['pipeline_id'] == "0"
+    assert missing['create']['content'] == "No Description Provided"
+    assert missing['create']['sales_rep'] == "No Sales Agent Selected"
+    assert missing['update']['sales_rep'] == ""
+    for column in ('createdate', 'schedule_date', 'closed_date'):
+        assert missing['create'][column] is None
+
+
+def test_unknown_status_has_no_pipeline():
+    premise = make_premise(1, work_orders=[{"id": 903, "status": "Not A Status"}])
+    _, ticket_payloads = hub.build_hubspot_payloads([premise], SALES_REPS)
+    assert ticket_payloads[(1, 903)]['pipeline_id'] is None
+    assert ticket_payloads[(1, 903)]['create']['hs_pipeline_stage'] is None
+
+
+def test_payloads_do_not_leak_nan():
+    premises = [
+        make_premise(1, sales_channel_id=None, updated_at=None, work_orders=[{"id": 904, "status": "Pre Order"}]),
+        make_premise(2, sales_channel_id=float('nan'), work_orders=[WORK_ORDER]),
+    ]
+    contact_payloads, ticket_payloads = hub.build_hubspot_payloads(premises, pd.DataFrame())
+
+    for payload in list(contact_payloads.values()) + list(ticket_payloads.values()):
+        assert_no_nan(payload)
+
+
+def merged_contact(premises):
+    contact_payloads, _ = hub.build_hubspot_payloads(premises, SALES_REPS)
+    return hub.merge_contact_payloads(premises, contact_payloads)
+
+
+def test_merge_prefers_most_recent_status_date():
+    older = make_premise(1, updated_at="2024-01-01T00:00:00+00:00", city="Old Town", sales_channel_id=6)
+    newer = make_premise(2, updated_at="2024-06-01T00:00:00+00:00", city="New Town")
+
+    for order in ([older, newer], [newer, older]):
+        winner, contact_data = merged_contact(order)
+        assert winner is newer
+        assert contact_data['properties']['city'] == "New Town"
+        assert contact_data['properties']['sales_rep'] == "Alice"
+
+
+def test_merge_ties_go_to_earlier_premise():
+    first = make_premise(1, city="First Town", sales_channel_id=6)
+    second = make_premise(2, city="Second Town")
+
+    winner, contact_data = merged_contact([first, second])
+    assert winner is first
+    assert contact_data['properties']['city'] == "First Town"
+    assert contact_data['properties']['sales_rep'] == "Bob"
+
+
+def test_merge_fills_empty_values_from_older_premises():
+    older = make_premise(1, updated_at="2024-01-01T00:00:00+00:00")
+    newer = make_premise(2, updated_at="2024-06-01T00:00:00+00:00")
+    newer['customer']['mobile_number'] = ""
+
+    _, contact_data = merged_contact([older, newer])
+    assert contact_data['properties']['phone'] == "0821234567"
+    assert contact_data['properties']['aex_id'] == 20
+
+
+def test_merge_takes_address_as_a_unit():
+    older = make_premise(1, updated_at="2024-01-01T00:00:00+00:00", city="Old Town")
+    newer = make_premise(2, updated_at="2024-06-01T00:00:00+00:00", city="")
+    del newer['services'][0]['service_details']['full_service']['premise']['postal_code']
+
+    _, contact_data = merged_contact([older, newer])
+    properties = contact_data['properties']
+    # The newer address is used whole, even where the older one had a value
+    assert (properties['city'], properties['zip'], properties['address']) == ("", "", "12 Main Rd")
+
+    newer['services'][0]['service_details']['full_service']['premise'] = {}
+    _, contact_data = merged_contact([older, newer])
+    properties = contact_data['properties']
+    # No address at all on the newer premise: the older address is kept whole
+    assert (properties['city'], properties['zip'], properties['address']) == ("Old Town", "8001", "12 Main Rd")
@@ -0,0 +1,72 @@
+import os
+import shutil
+
+import pytest
+
+from service_updates import snapshot
+from service_updates.snapshot import SnapshotReader
+
+
+def records(count):
+    return [{"id": service_id, "premise_id": service_id // 2, "name": f"service {service_id}"} for service_id in range(count)]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "premises.snap")
+
+
+@pytest.mark.parametrize("compression", sorted(snapshot.CODECS))
+def test_index_finds_records_by_service_and_premise_id(path, compression):
+    snapshot.write_snapshot(records(10), path, chunk_size=3, compression=compression)
+
+    with SnapshotReader(path) as reader:
+        assert len(reader) == 10
+        assert len(reader.index["chunks"]) == 4
+        assert reader.by_service_id(7) == records(10)[7]
+        assert reader.by_service_id(99) is None
+        assert reader.by_premise_id(2) == records(10)[4:6]
+        assert reader.by_premise_id(99) == []
+        assert list(reader) == records(10)
+
+
+def test_range_spans_chunks_and_clamps_to_the_end(path):
+    snapshot.write_snapshot(records(10), path, chunk_size=3)
+
+    with SnapshotReader(path) as reader:
+        assert reader.range(2, 7) == records(10)[2:7]
+        assert reader.range(3, 6) == records(10)[3:6]
+        assert reader.range(8) == records(10)[8:]
+        assert reader.range(5, 50) == records(10)[5:]
+        assert reader.range(4, 4) == []
+
+
+def test_empty_snapshot(path):
+    snapshot.write_snapshot([], path)
+
+    with SnapshotReader(path) as reader:
+        assert len(reader) == 0
+        assert list(reader) == []
+        assert reader.range(0, 10) == []
+        assert reader.by_service_id(1) is None
+    assert snapshot.read_snapshot(path) == []
+
+
+def test_rewrite_replaces_both_files(path):
+    snapshot.write_snapshot(records(10), path, chunk_size=3)
+    snapshot.write_snapshot(records(4), path, chunk_size=3)
+
+    assert snapshot.read_snapshot(path) == records(4)
+    assert not os.path.exists(f"{path}.tmp")
+    assert not os.path.exists(f"{snapshot.index_path(path)}.tmp")
+
+
+def test_reader_rejects_index_and_data_from_different_writes(path, monkeypatch):
+    monkeypatch.setattr(SnapshotReader, 'OPEN_ATTEMPTS', 2)
+    snapshot.write_snapshot(records(10), path, chunk_size=3)
+    shutil.copy(snapshot.index_path(path), f"{path}.old-idx")
+    snapshot.write_snapshot(records(4), path, chunk_size=3)
+    shutil.copy(f"{path}.old-idx", snapshot.index_path(path))
+
+    with pytest.raises(ValueError):
+        SnapshotReader(path)
@@ -0,0 +1,62 @@
+import itertools
+
+import pytest
+
+from service_updates import store
+
+
+@pytest.fixture(autouse=True)
+def state_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, 'STATE_DB', str(tmp_path / "state.db"))
+    # A strictly increasing clock, so changed_at / enriched_at order does not depend on timer resolution
+    ticks = itertools.count()
+    monkeypatch.setattr(store, '_now', lambda: f"2024-01-01T00:00:{next(ticks):06d}")
+
+
+def service(service_id, updated_at="2024-01-01"):
+    return {"id": service_id, "premise_id": service_id * 10, "customer_id": 7, "updated_at": updated_at}
+
+
+def work_order(work_order_id, status="Pre Order"):
+    return {"id": work_order_id, "status": status}
+
+
+def enriched(service_record, work_orders=()):
+    return {**service_record, "customer": {"id": 7},
+            "services": [{"service_details": {}, "work_orders": {"items": list(work_orders)}}]}
+
+
+def pending_ids(work_orders_by_service=None):
+    return [premise['id'] for premise in store.load_pending_services(work_orders_by_service)]
+
+
+def test_new_and_changed_services_are_pending_until_enriched():
+    store.upsert_services([service(1), service(2)])
+    assert pending_ids() == [1, 2]
+
+    store.upsert_enriched_premises([enriched(service(1)), enriched(service(2))])
+    assert pending_ids() == []
+
+    # Re-fetching an identical record does not make it pending; a changed one does
+    store.upsert_services([service(1), service(2, updated_at="2024-02-01")])
+    assert pending_ids() == [2]
+
+
+def test_changed_work_orders_make_an_unchanged_service_pending():
+    store.upsert_services([service(1), service(2)])
+    store.upsert_enriched_premises([enriched(service(1), [work_order(11)]), enriched(service(2), [work_order(21)])])
+
+    unchanged = {1: {"items": [work_order(11)]}, 2: {"items": [work_order(21)]}}
+    assert store.services_with_changed_work_orders(unchanged) == set()
+    assert pending_ids(unchanged) == []
+
+    window = {1: {"items": [work_order(11, status="Fiber Ready")]}, 2: {"items": [work_order(21), work_order(22)]}}
+    assert store.services_with_changed_work_orders(window) == {1, 2}
+    assert pending_ids(window) == [1, 2]
+
+
+def test_work_order_changes_for_unknown_services_are_ignored():
+    store.upsert_services([service(1)])
+    store.upsert_enriched_premises([enriched(service(1))])
+
+    assert pending_ids({99: {"items": [work_order(991)]}}) == []